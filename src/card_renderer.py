@@ -0,0 +1,138 @@
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow es opcional: sin él las imágenes se generan con imgkit
+    Image = ImageDraw = ImageFont = None
+
+# Medidas y colores de clima_template.html, en píxeles
+BODY_PADDING = 20
+CONTAINER_WIDTH = 600
+CONTAINER_PADDING = 30
+CONTAINER_RADIUS = 10
+CARD_WIDTH = CONTAINER_WIDTH + 2 * BODY_PADDING
+BODY_COLOR = "#f0f0f0"
+CONTAINER_COLOR = "#451925"
+TITLE_COLOR = "#2c3e50"
+TEMPERATURE_COLOR = "#e67e22"
+MUTED_COLOR = "#95a5a6"
+BORDER_COLOR = "#eeeeee"
+TITLE = "Boletín Climático"
+FOOTER = "Boletín generado automáticamente - Datos meteorológicos proporcionados por Asbama"
+
+# Fuentes candidatas, en orden de preferencia (Arial es la de la plantilla)
+FONT_FILES = {
+    False: ("arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"),
+    True: ("arialbd.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf"),
+}
+_fonts = {}
+
+def is_available():
+    """
+    Retorna True si Pillow está instalado y se pueden dibujar las tarjetas.
+    """
+    return Image is not None
+
+def load_font(size, bold=False):
+    """
+    Carga (una sola vez por tamaño) la primera fuente disponible de FONT_FILES;
+    si no hay ninguna se usa la fuente por defecto de Pillow.
+    """
+    if (size, bold) not in _fonts:
+        font = None
+        for font_file in FONT_FILES[bold]:
+            try:
+                font = ImageFont.truetype(font_file, size)
+                break
+            except OSError:
+                continue
+        if font is None:
+            font = ImageFont.load_default(size)
+        _fonts[(size, bold)] = font
+    return _fonts[(size, bold)]
+
+def wrap_text(draw, text, font, width):
+    """
+    Parte el texto en líneas que no superen width píxeles, cortando entre palabras.
+    """
+    lines = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines or [""]
+
+def layout_card(draw, city, temperature, date_str):
+    """
+    Calcula la posición de cada elemento de la tarjeta, de arriba hacia abajo.
+    Retorna (operaciones de dibujo, alto total de la imagen).
+    """
+    inner_left = BODY_PADDING + CONTAINER_PADDING
+    inner_width = CONTAINER_WIDTH - 2 * CONTAINER_PADDING
+    center = CARD_WIDTH / 2
+    operations = []
+    y = BODY_PADDING + CONTAINER_PADDING
+
+    def add_lines(text, font, color, line_height):
+        nonlocal y
+        for line in wrap_text(draw, text, font, inner_width):
+            operations.append(("text", (center, y), line, font, color))
+            y += line_height
+
+    # Encabezado
+    add_lines(TITLE, load_font(32, bold=True), TITLE_COLOR, 37)
+    y += 20
+    operations.append(("line", [(inner_left, y), (inner_left + inner_width, y)], BORDER_COLOR, 2))
+    y += 2 + 25
+
+    # Bloque dinámico: temperatura, fecha y ciudad
+    add_lines(f"{temperature}°C", load_font(48, bold=True), TEMPERATURE_COLOR, 55)
+    y += 5
+    add_lines(date_str, load_font(14), MUTED_COLOR, 16)
+    add_lines(city, load_font(14), MUTED_COLOR, 16)
+    y += 30
+
+    # Pie de página
+    operations.append(("line", [(inner_left, y), (inner_left + inner_width, y)], BORDER_COLOR, 1))
+    y += 1 + 20
+    add_lines(FOOTER, load_font(12), MUTED_COLOR, 14)
+    y += CONTAINER_PADDING + BODY_PADDING
+    return operations, y
+
+def render_bulletin_card(city, temperature, date_str, output_filename):
+    """
+    Dibuja con Pillow la tarjeta del boletín (diseño de clima_template.html) con la
+    temperatura, la fecha y la ciudad, y la guarda en output_filename.
+    Retorna True si la imagen se generó, False en caso contrario.
+    """
+    if not is_available():
+        print(f"Pillow no está instalado, no se puede generar '{output_filename}'.")
+        return False
+    try:
+        measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        operations, height = layout_card(measure, str(city), temperature, str(date_str))
+
+        image = Image.new("RGB", (CARD_WIDTH, height), BODY_COLOR)
+        draw = ImageDraw.Draw(image)
+        draw.rounded_rectangle(
+            [BODY_PADDING, BODY_PADDING, BODY_PADDING + CONTAINER_WIDTH, height - BODY_PADDING],
+            radius=CONTAINER_RADIUS,
+            fill=CONTAINER_COLOR,
+        )
+        for operation in operations:
+            if operation[0] == "text":
+                _, position, text, font, color = operation
+                draw.text(position, text, font=font, fill=color, anchor="mt")
+            else:
+                _, points, color, width = operation
+                draw.line(points, fill=color, width=width)
+        image.save(output_filename, format="PNG")
+        print(f"Imagen guardada: {output_filename}")
+        return True
+    except Exception as e:
+        print(f"Error al generar la imagen '{output_filename}': {e}")
+        return False
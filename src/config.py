@@ -5,4 +5,68 @@ MAUTIC_PASSWORD = 'Khiara1919;'
 EMAIL_TEMPLATE_ID = 1   
 SMS_TEMPLATE_ID   = 1  
 CAMPAIGN_ORIGINAL_ID = 1   
-BASE_CAMPAIGN_NAME = "Campaña Clonada - Envío recurrente"
\ No newline at end of file
+BASE_CAMPAIGN_NAME = "Campaña Clonada - Envío recurrente"
+
+# Cliente HTTP de Mautic (sesión con pool de conexiones)
+MAUTIC_POOL_SIZE = 30           # conexiones keep-alive por host
+MAUTIC_TIMEOUT = (5, 30)        # (timeout de conexión, timeout de lectura) en segundos
+MAUTIC_MAX_RETRIES = 3          # reintentos ante errores de red, 5xx y 429
+MAUTIC_BACKOFF_FACTOR = 0.5     # espera entre reintentos: 0.5s, 1s, 2s...
+MAUTIC_PAGE_SIZE = 200          # registros por página en los listados paginados
+
+# Importación de contactos (import_contacts.py)
+IMPORT_MODE = "batch"           # "batch", "async" o "sequential"
+IMPORT_BATCH_SIZE = 200         # contactos por petición a los endpoints batch
+IMPORT_CONCURRENCY = 30         # contactos en vuelo a la vez en modo "async"
+IMPORT_USE_CONTACT_INDEX = True # comparar contra un índice por correo en lugar de buscar cada contacto
+IMPORT_USE_STATE_CACHE = True   # omitir los registros sin cambios desde la última importación
+CONTACT_STATE_PATH = 'contact_state.sqlite3'
+
+# Archivo de usuarios (users_reader.py)
+USERS_FILE = 'users.json'
+USERS_FILE_FORMAT = "auto"      # "json" (array), "ndjson" o "auto" (según la extensión)
+USERS_READ_CHUNK_SIZE = 65536   # caracteres leídos por bloque al recorrer el array JSON
+
+# Segmentos (create_segments.py)
+SEGMENT_ADD_CHUNK_SIZE = 200    # contactos por petición al agregar miembros a un segmento
+SEGMENT_RECONCILE = True        # aplicar solo altas y bajas en lugar de re-agregar a todos
+
+# Geocodificación de ciudades (geocoding.py)
+GEOCODE_CACHE_PATH = 'geocode_cache.sqlite3'
+GEOCODE_CACHE_TTL_DAYS = 365    # vigencia de las coordenadas guardadas
+GEOCODE_NEGATIVE_TTL_DAYS = 7   # vigencia de las ciudades que no se pudieron resolver
+GEOCODE_MIN_INTERVAL = 1.0      # segundos entre consultas a Nominatim (límite de 1 req/s)
+GEOCODE_TIMEOUT = 10            # timeout de cada consulta a Nominatim, en segundos
+GEOCODE_USE_GAZETTEER = True    # resolver primero con el gazetteer local, sin red
+GEOCODE_REMOTE_FALLBACK = True  # consultar Nominatim cuando la ciudad no está en el gazetteer ni en la cache
+GAZETTEER_PATH = 'gazetteer.csv'  # CSV con columnas city, country, lat, lon y, opcional, city_alias
+
+# Clima (weather.py)
+WEATHER_BATCH_SIZE = 100        # ubicaciones por petición a Open-Meteo
+WEATHER_TIMEOUT = 15            # timeout de cada consulta a Open-Meteo, en segundos
+WEATHER_GRID_RESOLUTION = 0.1   # grados por celda; ciudades en la misma celda comparten consulta (0 = sin agrupar)
+WEATHER_SNAPSHOT_PATH = 'weather_snapshot.json'  # foto del clima compartida por mails y SMS
+WEATHER_SNAPSHOT_MAX_AGE = 3600 # segundos durante los que se reutiliza la foto guardada
+
+# Templates de email y SMS (create_mails.py, create_sms.py)
+TEMPLATE_STATE_PATH = 'template_state.sqlite3'  # hash del último contenido enviado a cada template
+TEMPLATE_FORCE_UPDATE = False   # actualizar los templates aunque su contenido no haya cambiado
+BULLETIN_MANIFEST_PATH = 'bulletins.json'  # boletines de la última ejecución, leídos por la etapa de imágenes
+
+# Imágenes de los boletines (generate_images.py)
+IMAGE_OUTPUT_DIR = 'email_images'
+IMAGE_RENDER_WORKERS = None     # procesos que generan imágenes en paralelo (None = uno por núcleo, 1 = en serie)
+IMAGE_RENDERER = "imgkit"       # "imgkit" (wkhtmltoimage) o "pillow" (tarjeta dibujada sin procesos externos)
+IMAGE_FORMAT = "png"            # "png", "png8" (PNG con paleta) o "webp"
+IMAGE_QUALITY = 80              # calidad de las imágenes WebP (0-100)
+IMAGE_PALETTE_COLORS = 256      # colores de la paleta en formato "png8"
+IMAGE_TARGET_WIDTH = None       # ancho máximo en píxeles (None = sin cambiar)
+IMAGE_CROP_TO_CONTENT = False   # recortar los márgenes del color de fondo
+IMAGE_MAX_BYTES = None          # tamaño máximo de cada imagen en bytes (None = sin límite)
+IMAGE_USE_CACHE = True          # reutilizar las imágenes cuyo HTML y opciones no cambiaron
+IMAGE_CACHE_DIR = 'render_cache'  # imágenes generadas, indexadas por hash del HTML y las opciones
+IMAGE_CACHE_MAX_AGE_DAYS = 30   # se borran las entradas sin usar en este tiempo
+IMAGE_CACHE_MAX_ENTRIES = 20000 # máximo de imágenes en la cache; se borran las menos usadas
+
+# Campañas (create_campaigns.py)
+CAMPAIGN_PRUNE_DUPLICATES = True   # eliminar las campañas repetidas de una ciudad, conservando la más antigua
@@ -0,0 +1,73 @@
+import requests
+from mautic_client import iter_contacts
+from import_contacts import extract_field, normalize_value
+
+# Campos de suscripción que se indexan por ciudad
+SUBSCRIPTION_FIELDS = ("climabulletin", "forecastbulletin")
+
+class ContactSnapshot:
+    """
+    Vista de los contactos de Mautic construida con una sola descarga, compartida por
+    las etapas de segmentos, mails y SMS:
+      - cities: todas las ciudades mencionadas por algún contacto.
+      - city_contacts: ciudad → ids de los contactos que la tienen en "cities".
+      - city_subscribers: ciudad → {campo de suscripción → ids suscritos}.
+      - complete: False si la descarga se interrumpió; en ese caso el índice está incompleto.
+    """
+
+    def __init__(self):
+        self.cities = set()
+        self.city_contacts = {}
+        self.city_subscribers = {}
+        self.contact_count = 0
+        self.complete = True
+
+    def add_contact(self, contact):
+        contact_id = contact.get("id")
+        self.contact_count += 1
+        for city in split_cities(extract_field(contact, "cities")):
+            self.cities.add(city)
+            self.city_contacts.setdefault(city, set()).add(contact_id)
+            subscribers = self.city_subscribers.setdefault(city, {field: set() for field in SUBSCRIPTION_FIELDS})
+            for field in SUBSCRIPTION_FIELDS:
+                if normalize_value(field, extract_field(contact, field)) is True:
+                    subscribers[field].add(contact_id)
+
+    def subscribers(self, city, field="climabulletin"):
+        """
+        Retorna los ids de los contactos de la ciudad suscritos al boletín indicado.
+        """
+        return self.city_subscribers.get(city, {}).get(field, set())
+
+def split_cities(raw_cities):
+    """
+    Separa el campo "cities" (string con ciudades separadas por "-") en una lista de ciudades.
+    """
+    cities_str = normalize_value("cities", raw_cities)
+    return [city.strip() for city in cities_str.split("-") if city.strip()]
+
+def build_contact_snapshot():
+    """
+    Descarga todos los contactos una sola vez (paginados, solo los campos necesarios)
+    y construye el índice ciudad → contactos.
+    """
+    snapshot = ContactSnapshot()
+    try:
+        for contact in iter_contacts(fields=["cities", *SUBSCRIPTION_FIELDS]):
+            snapshot.add_contact(contact)
+    except requests.RequestException as e:
+        print(f"Error al obtener contactos: {e}")
+        snapshot.complete = False
+    print(f"Contactos leídos: {snapshot.contact_count}; ciudades encontradas: {len(snapshot.cities)}")
+    return snapshot
+
+_snapshot = None
+
+def get_contact_snapshot(refresh=False):
+    """
+    Retorna la vista de contactos de esta ejecución; se construye la primera vez que se pide.
+    """
+    global _snapshot
+    if _snapshot is None or refresh:
+        _snapshot = build_contact_snapshot()
+    return _snapshot
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from config import CONTACT_STATE_PATH
+
+# Cada cuántas escrituras se confirma la transacción en disco
+COMMIT_EVERY = 1000
+
+def contact_hash(contact_data):
+    """
+    Hash estable de los valores normalizados de un contacto.
+    """
+    serialized = json.dumps(contact_data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+class ContactStateCache:
+    """
+    Estado local de la última importación, guardado en SQLite y indexado por correo:
+    id del contacto en Mautic y hash de sus valores normalizados.
+    Un registro cuyo hash coincide con el guardado no ha cambiado desde la última
+    importación y puede omitirse sin consultar la API.
+    Los cambios hechos directamente en Mautic no se detectan; para eso se fuerza una
+    resincronización completa con force_resync: la caché no se consulta, pero sí se
+    actualiza con el resultado de la importación.
+    """
+
+    def __init__(self, path=CONTACT_STATE_PATH, force_resync=False):
+        self.force_resync = force_resync
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS contact_state ("
+            " email TEXT PRIMARY KEY,"
+            " contact_id INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def is_unchanged(self, mail_key, contact_data):
+        """
+        Retorna True si el contacto ya se importó con exactamente estos valores.
+        """
+        if self.force_resync:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash FROM contact_state WHERE email = ?", (mail_key,)
+            ).fetchone()
+        return row is not None and row[0] == contact_hash(contact_data)
+
+    def remember(self, mail_key, contact_id, contact_data):
+        """
+        Guarda el id y el hash del contacto tal como quedó en Mautic.
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO contact_state (email, contact_id, hash, updated_at) VALUES (?, ?, ?, ?)",
+                (mail_key, contact_id, contact_hash(contact_data), datetime.now().isoformat(timespec="seconds")),
+            )
+            self.pending_writes += 1
+            if self.pending_writes >= COMMIT_EVERY:
+                self.connection.commit()
+                self.pending_writes = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
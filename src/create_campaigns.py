@@ -1,97 +1,168 @@
 import requests
-from config import MAUTIC_BASE_URL, MAUTIC_USERNAME, MAUTIC_PASSWORD
+from mautic_client import get_client
+from template_index import get_template_index, get_template_id
+from template_state import content_hash, get_template_state
+from create_segments import SEGMENT_PREFIX, get_segment_index, get_segment_by_name
+from config import CAMPAIGN_PRUNE_DUPLICATES
 
-def get_segments():
-    """
-    Retorna todas las listas/segmentos disponibles en Mautic.
-    """
-    url = f"{MAUTIC_BASE_URL}/api/segments"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        lists_data = data.get("lists", {})
-        # Dependiendo de la versión de Mautic, "lists_data" puede ser dict o list.
-        # Normalizamos a una lista de segmentos.
-        if isinstance(lists_data, dict):
-            return lists_data.values()
-        return lists_data
-    except requests.RequestException as e:
-        print(f"Error al obtener segmentos: {e}")
-        return []
+# Prefijo de las campañas que gestiona esta etapa
+CAMPAIGN_PREFIX = "Campaña - "
+# Filtro de búsqueda de Mautic para el listado de campañas. Mautic separa la búsqueda
+# en palabras, así que se filtra por la primera y el prefijo exacto se comprueba aquí
+CAMPAIGN_SEARCH = "Campaña"
+# Campos de cada evento que se comparan para decidir si una campaña cambió
+EVENT_FIELDS = (
+    "name", "type", "eventType", "order", "triggerInterval", "triggerIntervalUnit",
+    "triggerMode", "decisionPath",
+)
+
+# Cache nombre → {"campaign": campaña más antigua, "duplicates": ids de las demás},
+# compartida durante la ejecución
+_campaign_index = None
 
 def get_segment_id_by_name(segment_name):
     """
     Retorna el ID del segmento con nombre 'segment_name', o None si no existe.
+    Se usa la cache de segmentos de create_segments, descargada una sola vez.
     """
-    segments = get_segments()
-    for seg in segments:
-        if seg.get("name") == segment_name:
-            return seg.get("id")
-    return None
+    return get_segment_by_name(segment_name)
 
 def get_email_template_by_name(email_name):
     """
     Busca un email template por nombre y retorna su ID, o None si no existe.
     """
-    url = f"{MAUTIC_BASE_URL}/api/emails?where[0][col]=name&where[0][expr]=eq&where[0][val]={email_name}"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        emails = data.get("emails", {})
-        for email in emails.values():
-            if email.get("name", "").strip().lower() == email_name.strip().lower():
-                return email.get("id")
-    except requests.RequestException as e:
-        print(f"Error al buscar email template '{email_name}': {e}")
-    return None
+    return get_template_id("email", email_name)
 
 def get_sms_by_name(sms_name):
     """
     Busca un SMS por nombre y retorna su ID, o None si no existe.
     """
-    url = f"{MAUTIC_BASE_URL}/api/smses?where[0][col]=name&where[0][expr]=eq&where[0][val]={sms_name}"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        messages = data.get("smses", {})
-        for sms in messages.values():
-            if sms.get("name", "").strip().lower() == sms_name.strip().lower():
-                return sms.get("id")
-    except requests.RequestException as e:
-        print(f"Error al buscar SMS '{sms_name}': {e}")
-    return None
+    return get_template_id("sms", sms_name)
 
-def create_campaign_for_city(city):
+def load_campaign_index():
     """
-    Crea una campaña en Mautic que apunte al segmento 'Boletin clima - {city}' y
-    tenga 3 acciones: enviar email, enviar SMS y enviar webhook.
+    Descarga (paginado y filtrado en Mautic por CAMPAIGN_SEARCH) las campañas
+    "Campaña - *" y retorna un dict nombre → {"campaign", "duplicates"}.
+    De cada nombre se guarda la definición completa solo de la campaña más antigua; de
+    las demás, duplicados creados por ejecuciones anteriores, solo se guarda el id.
     """
-    segment_name = f"Boletin clima - {city}"
-    segment_id = get_segment_id_by_name(segment_name)
-    if not segment_id:
-        print(f"No se encontró el segmento '{segment_name}'. No se creará campaña para {city}.")
-        return
-    
-    # Obtener el ID del email y del SMS
-    email_name = f"Boletin climatico - {city}"
-    email_id = get_email_template_by_name(email_name)
-    if not email_id:
-        print(f"No se encontró el email '{email_name}'. No se creará campaña para {city}.")
-        return
-    
-    sms_name = f"Boletin climatico - {city}"
-    sms_id = get_sms_by_name(sms_name)
-    if not sms_id:
-        print(f"No se encontró el SMS '{sms_name}'. No se creará campaña para {city}.")
-        return
-    
-    # Estructura del payload para crear la campaña
+    index = {}
+    for campaign in get_client().iter_entities("/api/campaigns", "campaigns", params={"search": CAMPAIGN_SEARCH}):
+        name = campaign.get("name")
+        if not name or not name.startswith(CAMPAIGN_PREFIX):
+            continue
+        entry = index.get(name)
+        if entry is None:
+            index[name] = {"campaign": campaign, "duplicates": []}
+        elif int(campaign.get("id") or 0) < int(entry["campaign"].get("id") or 0):
+            entry["duplicates"].append(entry["campaign"].get("id"))
+            entry["campaign"] = campaign
+        else:
+            entry["duplicates"].append(campaign.get("id"))
+    return index
+
+def get_campaign_index(refresh=False):
+    """
+    Retorna el dict nombre → {"campaign", "duplicates"}. Se descarga una sola vez y se reutiliza en las
+    siguientes llamadas; con refresh=True se vuelve a descargar.
+    Retorna None si no se pudo descargar, para no crear campañas que quizá ya existen.
+    """
+    global _campaign_index
+    if _campaign_index is None or refresh:
+        try:
+            _campaign_index = load_campaign_index()
+        except requests.RequestException as e:
+            print(f"Error al obtener campañas: {e}")
+            return None
+    return _campaign_index
+
+def normalize_value(value):
+    """
+    Normaliza un valor para compararlo con lo que retorna Mautic, que puede devolver
+    los ids y números como texto y los listados como dict indexados.
+    """
+    if isinstance(value, dict):
+        return {str(k): normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(v) for v in value]
+    if value is None:
+        return None
+    return str(value)
+
+def entity_id(value):
+    """
+    Retorna el id de una referencia que puede venir como {"id": ...} o como el id solo.
+    """
+    if isinstance(value, dict):
+        value = value.get("id")
+    return None if value is None else str(value)
+
+def as_list(value):
+    if isinstance(value, dict):
+        return list(value.values())
+    return list(value or [])
+
+def campaign_signature(campaign, reference=None):
+    """
+    Retorna una representación comparable de la definición de una campaña: nombre,
+    descripción, publicación, segmentos y eventos (con sus propiedades y su evento padre).
+    Los padres se identifican por el nombre del evento, porque los ids cambian entre la
+    campaña enviada ("new1", ...) y la guardada en Mautic.
+    Si se recibe reference (la campaña deseada), de las propiedades de cada evento solo se
+    comparan las que define la referencia, ya que Mautic agrega otras por su cuenta.
+    """
+    events = as_list(campaign.get("events"))
+    names_by_id = {entity_id(event): event.get("name") for event in events}
+    reference_properties = {}
+    if reference is not None:
+        for event in as_list(reference.get("events")):
+            reference_properties[event.get("name")] = set(event.get("properties") or {}) - {"canvasSettings"}
+
+    signature_events = []
+    for event in events:
+        properties = event.get("properties") or {}
+        keys = reference_properties.get(event.get("name"), set(properties) - {"canvasSettings"})
+        signature_events.append({
+            **{field: normalize_value(event.get(field)) for field in EVENT_FIELDS},
+            "properties": {key: normalize_value(properties.get(key)) for key in sorted(keys)},
+            "parent": names_by_id.get(entity_id(event.get("parent"))),
+        })
+    signature_events.sort(key=lambda event: (event["order"] or "", event["name"] or ""))
+
+    return {
+        "name": campaign.get("name"),
+        "description": campaign.get("description"),
+        "isPublished": bool(campaign.get("isPublished")),
+        "lists": sorted(entity_id(segment) for segment in as_list(campaign.get("lists"))),
+        "events": signature_events,
+    }
+
+def bulletin_revision(email_id, sms_id):
+    """
+    Identifica el contenido actual del boletín de una ciudad: un hash corto del último
+    contenido enviado a su email y a su SMS (ver template_state).
+    Retorna None si no se conoce el contenido de alguno de los dos.
+    """
+    template_state = get_template_state()
+    email_hash = template_state.get_hash("email", email_id)
+    sms_hash = template_state.get_hash("sms", sms_id)
+    if email_hash is None or sms_hash is None:
+        return None
+    return content_hash(email_hash + sms_hash)[:12]
+
+def build_campaign_payload(city, segment_id, email_id, sms_id, revision=None):
+    """
+    Arma la definición de la campaña de la ciudad: el segmento 'Boletin clima - {city}'
+    y 3 acciones: enviar email, enviar SMS y enviar webhook.
+    revision (ver bulletin_revision) se guarda en la descripción, para saber con qué
+    contenido del boletín se crearon los eventos de la campaña.
+    """
+    description = f"Campaña para {city}"
+    if revision:
+        description = f"{description} (boletín {revision})"
     campaign_payload = {
         "name": f"Campaña - {city}",
-        "description": f"Campaña para {city}",
+        "description": description,
         "isPublished": True,
         "publishUp": None,
         "publishDown": None,
@@ -262,29 +333,148 @@ def create_campaign_for_city(city):
             ]
         }
     }
-    
-    # Enviamos la petición para crear la campaña
-    url = f"{MAUTIC_BASE_URL}/api/campaigns/new"
+    return campaign_payload
+
+def create_campaign(city, campaign_payload):
+    """
+    Crea la campaña en Mautic. Retorna su ID, o None si no se pudo crear.
+    """
+    url = "/api/campaigns/new"
     try:
-        response = requests.post(url, json=campaign_payload,
-                                auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
+        response = get_client().post(url, json=campaign_payload)
         response.raise_for_status()
         data = response.json()
         campaign_id = data.get("campaign", {}).get("id")
         print(f"Campaña para '{city}' creada con ID: {campaign_id}")
+        return campaign_id
     except requests.RequestException as e:
         print(f"Error al crear la campaña para '{city}': {e}")
+        return None
 
-def create_campaigns():
+def update_campaign(city, campaign_id, campaign_payload):
+    """
+    Reemplaza la definición de una campaña existente (PUT), incluidos segmentos y eventos.
+    """
+    url = f"/api/campaigns/{campaign_id}/edit"
+    try:
+        response = get_client().put(url, json=campaign_payload)
+        response.raise_for_status()
+        print(f"Campaña para '{city}' (ID: {campaign_id}) actualizada.")
+        return True
+    except requests.RequestException as e:
+        print(f"Error al actualizar la campaña para '{city}' (ID: {campaign_id}): {e}")
+        return False
+
+def delete_campaign(campaign_id):
+    url = f"/api/campaigns/{campaign_id}/delete"
+    try:
+        response = get_client().delete(url)
+        response.raise_for_status()
+        print(f"Campaña duplicada (ID: {campaign_id}) eliminada.")
+        return True
+    except requests.RequestException as e:
+        print(f"Error al eliminar la campaña (ID: {campaign_id}): {e}")
+        return False
+
+def create_campaign_for_city(city, prune_duplicates=CAMPAIGN_PRUNE_DUPLICATES):
+    """
+    Crea o actualiza la campaña 'Campaña - {city}' que apunta al segmento
+    'Boletin clima - {city}' y tiene 3 acciones: enviar email, enviar SMS y enviar webhook.
+      - Si no existe, se crea.
+      - Si existe y su definición (segmento, email, SMS o eventos) o el contenido del
+        boletín cambió, se actualiza.
+      - Si existe y no cambió, no se toca.
+    Mautic ejecuta cada evento de una campaña una sola vez por contacto, así que para
+    que el boletín nuevo se envíe hay que volver a crear los eventos. La actualización
+    (PUT) reemplaza los eventos por los del payload, que se crean de nuevo y aún no se
+    ejecutaron para nadie; por eso la revisión del boletín forma parte de la definición
+    comparada (ver bulletin_revision). Si el boletín no cambió, la campaña no se toca
+    y no se vuelve a enviar lo mismo a los contactos.
+    Si hay varias campañas con el mismo nombre se conserva la más antigua; con
+    prune_duplicates=True (por defecto, CAMPAIGN_PRUNE_DUPLICATES) se eliminan las demás.
+    Retorna "created", "updated", "unchanged" o None si no se pudo procesar.
+    """
+    segment_name = f"{SEGMENT_PREFIX}{city}"
+    segment_id = get_segment_id_by_name(segment_name)
+    if not segment_id:
+        print(f"No se encontró el segmento '{segment_name}'. No se creará campaña para {city}.")
+        return None
+    
+    # Obtener el ID del email y del SMS
+    if get_template_index("email") is None or get_template_index("sms") is None:
+        print(f"No se pudo consultar los templates existentes. No se procesará la campaña para {city}.")
+        return None
+    email_name = f"Boletin climatico - {city}"
+    email_id = get_email_template_by_name(email_name)
+    if not email_id:
+        print(f"No se encontró el email '{email_name}'. No se creará campaña para {city}.")
+        return None
+    
+    sms_name = f"Boletin climatico - {city}"
+    sms_id = get_sms_by_name(sms_name)
+    if not sms_id:
+        print(f"No se encontró el SMS '{sms_name}'. No se creará campaña para {city}.")
+        return None
+
+    campaign_index = get_campaign_index()
+    if campaign_index is None:
+        print(f"No se pudo consultar las campañas existentes. No se procesará la campaña para {city}.")
+        return None
+
+    revision = bulletin_revision(email_id, sms_id)
+    campaign_payload = build_campaign_payload(city, segment_id, email_id, sms_id, revision)
+    entry = campaign_index.get(campaign_payload["name"])
+    if entry is not None and revision is None:
+        # Sin el contenido del boletín no se puede saber si cambió: se conserva la
+        # revisión guardada en la campaña para no reenviar ni dejar de enviar por eso
+        campaign_payload["description"] = entry["campaign"].get("description")
+    if entry is None:
+        campaign_id = create_campaign(city, campaign_payload)
+        if not campaign_id:
+            return None
+        campaign_index[campaign_payload["name"]] = {
+            "campaign": dict(campaign_payload, id=campaign_id),
+            "duplicates": [],
+        }
+        return "created"
+
+    campaign = entry["campaign"]
+    if entry["duplicates"]:
+        print(f"Hay {len(entry['duplicates'])} campañas duplicadas para '{city}'.")
+        if prune_duplicates:
+            entry["duplicates"] = [
+                duplicate_id for duplicate_id in entry["duplicates"] if not delete_campaign(duplicate_id)
+            ]
+
+    if campaign_signature(campaign, campaign_payload) == campaign_signature(campaign_payload):
+        print(f"La campaña para '{city}' (ID: {campaign.get('id')}) no ha cambiado.")
+        return "unchanged"
+    if campaign.get("description") != campaign_payload["description"]:
+        print(f"El boletín de '{city}' cambió: se vuelven a crear los eventos de su campaña.")
+    if not update_campaign(city, campaign.get("id"), campaign_payload):
+        return None
+    entry["campaign"] = dict(campaign_payload, id=campaign.get("id"))
+    return "updated"
+
+def create_campaigns(prune_duplicates=CAMPAIGN_PRUNE_DUPLICATES):
     """
     Busca todos los segmentos que tengan el prefijo 'Boletin clima - ' y para cada uno
-    obtiene el nombre de la ciudad y crea la campaña correspondiente.
+    obtiene el nombre de la ciudad y crea o actualiza la campaña correspondiente
+    (ver create_campaign_for_city), de modo que haya una sola campaña por ciudad.
+    Los segmentos se toman de la cache de create_segments.
     """
-    segments = get_segments()
-    for seg in segments:
-        seg_name = seg.get("name", "")
+    segment_index = get_segment_index()
+    if segment_index is None:
+        print("No se pudo consultar los segmentos, no se crearán ni actualizarán campañas.")
+        return
+    results = {"created": 0, "updated": 0, "unchanged": 0, None: 0}
+    for seg_name in sorted(name for name in segment_index if name):
         # Verificamos si el segmento sigue la convención "Boletin clima - X"
-        prefix = "Boletin clima - "
-        if seg_name.startswith(prefix):
-            city = seg_name.replace(prefix, "").strip()
-            create_campaign_for_city(city)
+        if seg_name.startswith(SEGMENT_PREFIX):
+            city = seg_name.replace(SEGMENT_PREFIX, "").strip()
+            results[create_campaign_for_city(city, prune_duplicates)] += 1
+
+    print(f"\nCampañas creadas: {results['created']}")
+    print(f"Campañas actualizadas: {results['updated']}")
+    print(f"Campañas sin cambios: {results['unchanged']}")
+    print(f"Campañas con error: {results[None]}")
@@ -1,80 +1,22 @@
-import requests
+import re
+import json
 from datetime import datetime
 from bs4 import BeautifulSoup
-from config import MAUTIC_BASE_URL, MAUTIC_USERNAME, MAUTIC_PASSWORD
+from mautic_client import get_client
+from contact_snapshot import get_contact_snapshot
+from weather import get_weather_snapshot, get_city_weather
+from template_state import get_template_state
+from template_index import TEMPLATE_PREFIX, get_template_index, get_template_id, remember_template
+from config import TEMPLATE_FORCE_UPDATE, BULLETIN_MANIFEST_PATH
 
-def get_all_contacts():
+def get_unique_cities(snapshot=None):
     """
-    Obtiene todos los contactos desde Mautic.
+    Retorna las ciudades únicas de los contactos, tomadas de la vista compartida de
+    contactos de esta ejecución (ver contact_snapshot).
     """
-    url = f"{MAUTIC_BASE_URL}/api/contacts"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        contacts = data.get("contacts", {})
-        return contacts.values()
-    except Exception as e:
-        print("Error al obtener contactos:", e)
-        return []
-
-def extract_field(contact, field):
-    """
-    Extrae el valor de un campo (buscando en 'core' y 'custom').
-    """
-    fields = contact.get("fields", {})
-    core_val = fields.get("core", {}).get(field, {}).get("value")
-    if core_val is not None:
-        return core_val
-    return fields.get("custom", {}).get(field, {}).get("value")
-
-def get_unique_cities():
-    """
-    Extrae las ciudades únicas de los contactos.
-    Se asume que el campo "cities" es un string con ciudades separadas por guiones.
-    """
-    contacts = get_all_contacts()
-    unique_cities = set()
-    for contact in contacts:
-        raw_cities = extract_field(contact, "cities")
-        if raw_cities:
-            # Separa asumiendo que las ciudades vienen separadas por "-"
-            cities = [c.strip() for c in raw_cities.split("-") if c.strip()]
-            unique_cities.update(cities)
-    return unique_cities
-
-def get_lat_lon_from_city(city):
-    """
-    Utiliza Nominatim para obtener latitud y longitud de una ciudad.
-    """
-    url = "https://nominatim.openstreetmap.org/search.php"
-    params = {"q": city, "format": "json"}
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    try:
-        response = requests.get(url, params=params, headers=headers)
-        data = response.json()
-        if data:
-            return data[0]["lat"], data[0]["lon"]
-    except Exception as e:
-        print(f"Error al obtener coordenadas para {city}: {e}")
-    return None, None
-
-def get_weather_from_lat_lon(lat, lon):
-    """
-    Consulta la API de Open-Meteo para obtener la temperatura actual y la fecha.
-    """
-    weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current_weather=true"
-    try:
-        response = requests.get(weather_url)
-        if response.status_code == 200:
-            weather_data = response.json()
-            current = weather_data.get("current_weather", {})
-            temperature = current.get("temperature")
-            date_now = current.get("time")
-            return temperature, date_now
-    except Exception as e:
-        print("Error al obtener clima:", e)
-    return None, None
+    if snapshot is None:
+        snapshot = get_contact_snapshot()
+    return snapshot.cities
 
 def format_date(date_str):
     """
@@ -87,73 +29,153 @@ def format_date(date_str):
         print(f"Error al formatear la fecha '{date_str}':", e)
         return date_str
 
-def generate_custom_html(city, temperature, date_str):
-    """
-    Lee la plantilla base (clima_template.html), inserta en el div.container
-    un bloque HTML con la temperatura, la fecha y el nombre de la ciudad, y retorna el HTML resultante.
-    """
-    formatted_date = format_date(date_str) if date_str else "Sin fecha"
-    
-    # Bloque dinámico a insertar
-    dynamic_block = f"""
+# Plantilla base del boletín y bloque dinámico que se inserta en su div.container
+TEMPLATE_PATH = "clima_template.html"
+DYNAMIC_BLOCK = """
     <div style="text-align: center; margin-bottom: 30px">
       <div style="font-size: 48px; color: #e67e22; font-weight: bold; margin-bottom: 5px;">
         <span>{temperature}</span>°C
       </div>
       <div style="color: #95a5a6; font-size: 14px">
-        {formatted_date}<br />
+        {date}<br />
         {city}
       </div>
     </div>
     """
-    
+# Marcas temporales con las que se ubican el bloque y los valores en el HTML serializado
+BLOCK_MARK = "@@bloque@@"
+SLOT_MARK = "@@slot:{}@@"
+SLOT_PATTERN = re.compile(r"@@slot:(\w+)@@")
+# Caracteres que BeautifulSoup interpreta o escapa; con ellos se usa el camino con parser
+UNSAFE_CHARS = ("<", ">", "&")
+# Espacios que BeautifulSoup colapsa cuando un texto está formado solo por ellos
+ASCII_SPACES = " \n\t\f\r"
+
+class BulletinTemplate:
+    """
+    Plantilla del boletín precompilada: se lee y se procesa con BeautifulSoup una sola vez,
+    y el HTML de cada ciudad se arma concatenando texto, sin volver a parsear.
+    parts alterna texto fijo y nombres de campo: [texto, campo, texto, campo, ..., texto].
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def render(self, **values):
+        return "".join(
+            part if i % 2 == 0 else values[part]
+            for i, part in enumerate(self.parts)
+        )
+
+def read_template(path=TEMPLATE_PATH):
     try:
-        with open("clima_template.html", "r", encoding="utf-8") as f:
-            template_html = f.read()
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
     except Exception as e:
-        print("Error al leer 'clima_template.html':", e)
+        print(f"Error al leer '{path}':", e)
+        return None
+
+def compile_bulletin_template(path=TEMPLATE_PATH):
+    """
+    Serializa la plantilla con el div.container vacío y el bloque dinámico con marcas en
+    lugar de los valores, tal como lo haría BeautifulSoup, y los parte en texto fijo y campos.
+    Retorna un BulletinTemplate, o None si no se pudo leer la plantilla o no tiene div.container.
+    """
+    template_html = read_template(path)
+    if template_html is None:
+        return None
+    soup = BeautifulSoup(template_html, "html.parser")
+    container = soup.find("div", class_="container")
+    if not container:
+        print("No se encontró un div con clase 'container' en la plantilla.")
+        return None
+    container.clear()
+    container.append(BLOCK_MARK)
+    prefix, suffix = str(soup).split(BLOCK_MARK)
+
+    marked_block = DYNAMIC_BLOCK.format(
+        temperature=SLOT_MARK.format("temperature"),
+        date=SLOT_MARK.format("date"),
+        city=SLOT_MARK.format("city"),
+    )
+    parts = SLOT_PATTERN.split(str(BeautifulSoup(marked_block, "html.parser")))
+    parts[0] = prefix + parts[0]
+    parts[-1] = parts[-1] + suffix
+    return BulletinTemplate(parts)
+
+_bulletin_template = None
+
+def get_bulletin_template():
+    """
+    Retorna la plantilla precompilada; se compila la primera vez que se pide.
+    """
+    global _bulletin_template
+    if _bulletin_template is None:
+        _bulletin_template = compile_bulletin_template()
+    return _bulletin_template
+
+def parse_custom_html(temperature, formatted_date, city):
+    """
+    Arma el HTML del boletín parseando la plantilla y el bloque dinámico con BeautifulSoup.
+    Se usa cuando algún valor contiene caracteres que el parser transforma.
+    """
+    template_html = read_template()
+    if template_html is None:
         return None
-    
     soup = BeautifulSoup(template_html, "html.parser")
     container = soup.find("div", class_="container")
     if container:
         container.clear()
+        dynamic_block = DYNAMIC_BLOCK.format(temperature=temperature, date=formatted_date, city=city)
         container.append(BeautifulSoup(dynamic_block, "html.parser"))
     else:
         print("No se encontró un div con clase 'container' en la plantilla.")
         return None
-    
     return str(soup)
 
+def generate_custom_html(city, temperature=None, date_str=None):
+    """
+    Arma el HTML del boletín de la ciudad a partir de la plantilla base (clima_template.html),
+    con un bloque en el div.container que muestra la temperatura, la fecha y el nombre de la ciudad.
+    Si no se recibe la temperatura se toma de la foto del clima de esta ejecución.
+    El HTML se arma sobre la plantilla precompilada (ver BulletinTemplate).
+    """
+    if temperature is None:
+        temperature, date_str = get_city_weather(city)
+        if temperature is None:
+            print(f"No hay datos de clima para {city}")
+            return None
+    formatted_date = format_date(date_str) if date_str else "Sin fecha"
+
+    values = {"temperature": f"{temperature}", "date": formatted_date, "city": f"{city}"}
+    if any(
+        not value.strip(ASCII_SPACES) or any(char in value for char in UNSAFE_CHARS)
+        for value in values.values()
+    ):
+        return parse_custom_html(temperature, formatted_date, city)
+    template = get_bulletin_template()
+    if template is None:
+        return None
+    return template.render(**values)
+
 def get_email_template_by_name(email_name):
     """
     Busca en Mautic si ya existe un email template con el nombre especificado.
     Retorna el ID del template si lo encuentra, o None en caso contrario.
-    Se consulta usando el campo "name" directamente, tal como se muestra en la respuesta de la API.
+    La búsqueda se hace sobre el índice de templates descargado una vez por ejecución
+    (ver template_index), sin consultar la API por cada ciudad.
     """
-    url = f"{MAUTIC_BASE_URL}/api/emails?where[0][col]=name&where[0][expr]=eq&where[0][val]={email_name}"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        emails = data.get("emails", {})
-        for email in emails.values():
-            template_name = email.get("name")
-            if template_name and template_name.strip().lower() == email_name.strip().lower():
-                return email.get("id")
-    except Exception as e:
-        print(f"Error al buscar email template '{email_name}': {e}")
-    return None
+    return get_template_id("email", email_name)
 
 def update_email_template(email_id, custom_html):
     """
     Actualiza el campo customHtml de un email template existente en Mautic.
     """
-    url = f"{MAUTIC_BASE_URL}/api/emails/{email_id}/edit"
+    url = f"/api/emails/{email_id}/edit"
     payload = {"customHtml": custom_html}
     headers = {"Content-Type": "application/json"}
     try:
-        response = requests.patch(url, json=payload, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD), headers=headers)
+        response = get_client().patch(url, json=payload, headers=headers)
         response.raise_for_status()
         print(f"Email template (ID: {email_id}) actualizado.")
         return True
@@ -161,7 +183,7 @@ def update_email_template(email_id, custom_html):
         print(f"Error al actualizar email template (ID: {email_id}): {e}")
         return False
 
-def create_email_template_in_mautic(city, custom_html):
+def create_email_template_in_mautic(city, custom_html, force_update=False):
     """
     Crea un email template en Mautic mediante la API. 
     Antes de crearlo, verifica si ya existe uno con el mismo nombre; en ese caso, solo actualiza su customHtml.
@@ -173,12 +195,22 @@ def create_email_template_in_mautic(city, custom_html):
     }
     """
     email_name = f"Boletin climatico - {city}"
+    if get_template_index("email") is None:
+        print(f"No se pudo consultar los templates existentes. No se creará ni actualizará el email template para '{city}'.")
+        return False
     existing_id = get_email_template_by_name(email_name)
+    template_state = get_template_state()
     if existing_id:
+        if not force_update and template_state.is_unchanged("email", existing_id, custom_html):
+            print(f"El email template para '{city}' no ha cambiado, no se actualiza.")
+            return True
         print(f"El email template para '{city}' ya existe. Se procederá a actualizar su customHtml.")
-        return update_email_template(existing_id, custom_html)
+        if update_email_template(existing_id, custom_html):
+            template_state.remember("email", existing_id, custom_html)
+            return True
+        return False
     else:
-        url = f"{MAUTIC_BASE_URL}/api/emails/new"
+        url = "/api/emails/new"
         payload = {
             "name": email_name,
             "subject": "Boletín Climático - {contactfield=firstname}",
@@ -186,37 +218,87 @@ def create_email_template_in_mautic(city, custom_html):
         }
         headers = {"Content-Type": "application/json"}
         try:
-            response = requests.post(url, json=payload, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD), headers=headers)
+            response = get_client().post(url, json=payload, headers=headers)
             response.raise_for_status()
             print(f"Email template creado para {city}")
+            created_id = (response.json().get("email") or {}).get("id")
+            if created_id:
+                remember_template("email", email_name, created_id)
+                template_state.remember("email", created_id, custom_html)
             return True
         except Exception as e:
             print(f"Error al crear el email template para {city}: {e}")
             return False
 
-def create_email_templates():
+def save_bulletin_manifest(bulletins, path=BULLETIN_MANIFEST_PATH):
+    """
+    Guarda en disco los boletines generados en esta ejecución (nombre del template →
+    ciudad, temperatura y fecha), para que la etapa de imágenes pueda ejecutarse por separado.
+    El HTML no se guarda: se vuelve a armar con generate_custom_html.
+    """
+    manifest = {
+        name: {"city": bulletin["city"], "temperature": bulletin["temperature"], "time": bulletin["time"]}
+        for name, bulletin in bulletins.items()
+    }
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"Error al guardar '{path}': {e}")
+
+def load_bulletin_manifest(path=BULLETIN_MANIFEST_PATH):
+    """
+    Lee los boletines guardados por la última ejecución de la etapa de mails y arma
+    de nuevo su HTML. Retorna un dict nombre del template → {"city", "temperature", "time", "html"}.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Error al leer '{path}': {e}")
+        return {}
+    bulletins = {}
+    for name, bulletin in manifest.items():
+        html = generate_custom_html(bulletin["city"], bulletin["temperature"], bulletin["time"])
+        if html:
+            bulletins[name] = dict(bulletin, html=html)
+    return bulletins
+
+def create_email_templates(snapshot=None, weather=None, force_update=TEMPLATE_FORCE_UPDATE):
     """
     Para cada ciudad extraída de los contactos:
-      - Obtiene coordenadas y clima.
+      - Toma su clima de la foto compartida de esta ejecución (ver weather.get_weather_snapshot).
       - Genera el HTML personalizado a partir de la plantilla base.
       - Crea o actualiza el email template en Mautic vía API.
+    Los templates cuyo contenido no cambió desde el último envío no se actualizan
+    (ver template_state); con force_update=True se actualizan todos.
+    Retorna los boletines generados (nombre del template → {"city", "temperature", "time", "html"}),
+    que también se guardan en BULLETIN_MANIFEST_PATH para la etapa de imágenes.
     """
-    unique_cities = get_unique_cities()
+    unique_cities = get_unique_cities(snapshot)
     print("Ciudades únicas encontradas:")
     for city in unique_cities:
         print(city)
     
+    # Todas las etapas leen el clima de la misma foto de esta ejecución
+    if weather is None:
+        weather = get_weather_snapshot(unique_cities)
+    bulletins = {}
     for city in unique_cities:
-        lat, lon = get_lat_lon_from_city(city)
-        if lat and lon:
-            temperature, date_now = get_weather_from_lat_lon(lat, lon)
-            if temperature is not None:
-                custom_html = generate_custom_html(city, temperature, date_now)
-                if custom_html:
-                    create_email_template_in_mautic(city, custom_html)
-                else:
-                    print(f"Error generando HTML para {city}")
-            else:
-                print(f"No se pudo obtener el clima para {city}")
+        entry = weather.get(city)
+        if entry is None:
+            print(f"No hay datos de clima para {city}")
+            continue
+        custom_html = generate_custom_html(city, entry["temperature"], entry["time"])
+        if custom_html:
+            bulletins[f"{TEMPLATE_PREFIX}{city}"] = {
+                "city": city,
+                "temperature": entry["temperature"],
+                "time": entry["time"],
+                "html": custom_html,
+            }
+            create_email_template_in_mautic(city, custom_html, force_update)
         else:
-            print(f"No se pudieron obtener coordenadas para {city}")
+            print(f"Error generando HTML para {city}")
+    save_bulletin_manifest(bulletins)
+    return bulletins
@@ -1,82 +1,58 @@
 import requests
-from config import MAUTIC_BASE_URL, MAUTIC_USERNAME, MAUTIC_PASSWORD
+from mautic_client import get_client, iter_contacts
+from contact_snapshot import get_contact_snapshot
+from config import SEGMENT_ADD_CHUNK_SIZE, SEGMENT_RECONCILE
 
-def get_all_contacts():
+# Prefijo de los segmentos que gestiona esta etapa
+SEGMENT_PREFIX = "Boletin clima - "
+
+# Cache nombre → id de los segmentos de Mautic, compartida durante la ejecución
+_segment_index = None
+# Alias de cada segmento (id → alias), necesario para consultar sus miembros
+_segment_aliases = {}
+
+def load_segment_index():
     """
-    Obtiene todos los contactos desde Mautic.
+    Descarga el listado completo de segmentos (paginado) y retorna un dict nombre → id.
     """
-    url = f"{MAUTIC_BASE_URL}/api/contacts"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        contacts = data.get("contacts", {})
-        return contacts.values()
-    except requests.RequestException as e:
-        print(f"Error al obtener contactos: {e}")
-        return []
-
-def extract_field(contact, field):
-    """
-    Extrae el valor de un campo desde la estructura de contacto.
-    """
-    fields = contact.get("fields", {})
-    core_val = fields.get("core", {}).get(field, {}).get("value")
-    if core_val is not None:
-        return core_val
-    return fields.get("custom", {}).get(field, {}).get("value")
-
-def normalize_value(field, value):
-    """
-    Normaliza el valor de un campo.
-      - Para 'climabulletin': retorna True/False.
-      - Para 'cities': se asume que ya es un string.
-    """
-    if field == "cities":
-        return value.strip() if value else ""
-    if field == "climabulletin":
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, int):
-            return value == 1
-        if isinstance(value, str):
-            val = value.strip().lower()
-            if val in ['true', '1', 'yes']:
-                return True
-            elif val in ['false', '0', 'no']:
-                return False
-        return False
-    if value is None:
-        return ""
-    return str(value).strip()
+    index = {}
+    for seg in get_client().iter_entities("/api/segments", "lists"):
+        index[seg.get("name")] = seg.get("id")
+        _segment_aliases[seg.get("id")] = seg.get("alias")
+    return index
 
-def get_segment_by_name(segment_name):
+def get_segment_index(refresh=False):
+    """
+    Retorna el dict nombre → id de los segmentos. Se descarga una sola vez y se reutiliza
+    en las siguientes llamadas; con refresh=True se vuelve a descargar.
+    Retorna None si no se pudo descargar: sin la lista no se sabe qué segmentos existen,
+    así que las etapas no deben crear ninguno.
+    """
+    global _segment_index
+    if _segment_index is None or refresh:
+        try:
+            _segment_index = load_segment_index()
+        except requests.RequestException as e:
+            print(f"Error al obtener segmentos: {e}")
+            return None
+    return _segment_index
+
+def get_segment_by_name(segment_name, refresh=False):
     """
     Busca en Mautic si ya existe un segmento con el nombre dado.
     Retorna el ID del segmento si lo encuentra o None en caso contrario.
+    La búsqueda se hace sobre la cache de segmentos, sin consultar la API cada vez.
     """
-    url = f"{MAUTIC_BASE_URL}/api/segments"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        lists_data = data.get("lists", [])
-        if isinstance(lists_data, dict):
-            segments = list(lists_data.values())
-        else:
-            segments = lists_data
-        for seg in segments:
-            if seg.get("name") == segment_name:
-                return seg.get("id")
-    except requests.RequestException as e:
-        print(f"Error al obtener segmentos: {e}")
-    return None
+    segment_index = get_segment_index(refresh)
+    if segment_index is None:
+        return None
+    return segment_index.get(segment_name)
 
 def create_segment(segment_name):
     """
     Crea un nuevo segmento en Mautic con el nombre dado.
     """
-    url = f"{MAUTIC_BASE_URL}/api/segments/new"
+    url = "/api/segments/new"
     headers = {'Content-Type': 'application/json'}
     # Se asume que la descripción usa el nombre de la ciudad extraído del segmento.
     city = segment_name.split(" - ")[1] if " - " in segment_name else segment_name
@@ -85,11 +61,14 @@ def create_segment(segment_name):
         "description": f"Segmento de contactos interesados en el clima de {city}"
     }
     try:
-        response = requests.post(url, json=payload, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD), headers=headers)
+        response = get_client().post(url, json=payload, headers=headers)
         response.raise_for_status()
         segment_info = response.json().get("list", {})
         segment_id = segment_info.get("id")
         print(f"Segmento creado: {segment_name} (ID: {segment_id})")
+        if _segment_index is not None:
+            _segment_index[segment_name] = segment_id
+        _segment_aliases[segment_id] = segment_info.get("alias")
         return segment_id
     except requests.RequestException as e:
         print(f"Error al crear segmento '{segment_name}': {e}")
@@ -99,9 +78,9 @@ def add_contact_to_segment(segment_id, contact_id):
     """
     Agrega el contacto al segmento utilizando el endpoint de Mautic.
     """
-    url = f"{MAUTIC_BASE_URL}/api/segments/{segment_id}/contact/{contact_id}/add"
+    url = f"/api/segments/{segment_id}/contact/{contact_id}/add"
     try:
-        response = requests.post(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
+        response = get_client().post(url)
         response.raise_for_status()
         print(f"Contacto {contact_id} agregado al segmento {segment_id}")
         return True
@@ -109,32 +88,142 @@ def add_contact_to_segment(segment_id, contact_id):
         print(f"Error al agregar contacto {contact_id} al segmento {segment_id}: {e}")
         return False
 
-def process_segments():
-    """
-    Procesa todos los contactos, filtrando aquellos interesados en el boletín de clima,
-    extrayendo las ciudades y asignándolos al segmento "Boletin clima - [nombre ciudad]".
-    """
-    contacts = get_all_contacts()
-    for contact in contacts:
-        contact_id = contact.get("id")
-        raw_clima = extract_field(contact, "climabulletin")
-        clima = normalize_value("climabulletin", raw_clima)
-        if clima is True:
-            # Obtener el campo cities (almacenado como string con separador "-")
-            raw_cities = extract_field(contact, "cities")
-            cities_str = normalize_value("cities", raw_cities)
-            if cities_str:
-                # Se asume que las ciudades están separadas por guiones ("-")
-                city_list = [city.strip() for city in cities_str.split("-") if city.strip()]
-                for city in city_list:
-                    segment_name = f"Boletin clima - {city}"
-                    # Verificar si el segmento ya existe, de lo contrario se crea
-                    segment_id = get_segment_by_name(segment_name)
-                    if not segment_id:
-                        segment_id = create_segment(segment_name)
-                    if segment_id:
-                        add_contact_to_segment(segment_id, contact_id)
-            else:
-                print(f"Contacto {contact_id} no tiene ciudades definidas.")
+def add_contacts_to_segment(segment_id, contact_ids):
+    """
+    Agrega varios contactos al segmento en una sola petición al endpoint batch de Mautic.
+    Retorna un dict contact_id → True/False con el resultado de cada contacto.
+    """
+    url = f"/api/segments/{segment_id}/contacts/add"
+    try:
+        response = get_client().post(url, json={"ids": list(contact_ids)})
+        response.raise_for_status()
+        details = response.json().get("details") or {}
+    except requests.RequestException as e:
+        print(f"Error al agregar {len(contact_ids)} contactos al segmento {segment_id}: {e}")
+        return {contact_id: False for contact_id in contact_ids}
+
+    results = {}
+    for contact_id in contact_ids:
+        detail = details.get(str(contact_id), details.get(contact_id)) or {}
+        results[contact_id] = bool(detail.get("success"))
+        if results[contact_id]:
+            print(f"Contacto {contact_id} agregado al segmento {segment_id}")
         else:
-            print(f"Contacto {contact_id} no está interesado en el boletin de clima.")
+            print(f"Error al agregar contacto {contact_id} al segmento {segment_id}")
+    return results
+
+def remove_contact_from_segment(segment_id, contact_id):
+    """
+    Quita el contacto del segmento utilizando el endpoint de Mautic.
+    """
+    url = f"/api/segments/{segment_id}/contact/{contact_id}/remove"
+    try:
+        response = get_client().post(url)
+        response.raise_for_status()
+        print(f"Contacto {contact_id} quitado del segmento {segment_id}")
+        return True
+    except requests.RequestException as e:
+        print(f"Error al quitar contacto {contact_id} del segmento {segment_id}: {e}")
+        return False
+
+def get_segment_members(segment_id):
+    """
+    Retorna el conjunto de ids de los contactos que hoy pertenecen al segmento.
+    """
+    alias = _segment_aliases.get(segment_id)
+    if not alias:
+        raise ValueError(f"No se conoce el alias del segmento {segment_id}.")
+    return {contact.get("id") for contact in iter_contacts(fields=[], search=f"segment:{alias}")}
+
+def get_desired_segments(snapshot):
+    """
+    Retorna, a partir de la vista de contactos, el dict nombre de segmento → ids de los
+    contactos suscritos al boletín de clima de esa ciudad.
+    """
+    desired = {}
+    for city in snapshot.cities:
+        members = snapshot.subscribers(city, "climabulletin")
+        if members:
+            desired[f"{SEGMENT_PREFIX}{city}"] = members
+    return desired
+
+def reconcile_segments(snapshot, chunk_size=SEGMENT_ADD_CHUNK_SIZE):
+    """
+    Sincroniza los segmentos "Boletin clima - [ciudad]" con los contactos:
+      - Calcula la membresía deseada de cada segmento a partir de climabulletin y cities.
+      - Descarga la membresía actual de cada segmento gestionado.
+      - Agrega solo los contactos que faltan y quita los que ya no corresponden
+        (dejaron la ciudad o desactivaron el boletín).
+    Si la vista de contactos está incompleta no se quita a nadie, para no vaciar
+    segmentos a partir de una lista parcial.
+    """
+    if not snapshot.complete:
+        print("La lista de contactos está incompleta, no se sincronizarán los segmentos.")
+        return
+    desired = get_desired_segments(snapshot)
+
+    segment_index = get_segment_index()
+    if segment_index is None:
+        print("No se pudo consultar los segmentos existentes, no se sincronizarán los segmentos.")
+        return
+    managed = set(desired) | {name for name in segment_index if name and name.startswith(SEGMENT_PREFIX)}
+    added = removed = 0
+    for segment_name in sorted(managed):
+        members = desired.get(segment_name, set())
+        segment_id = get_segment_by_name(segment_name)
+        if not segment_id:
+            if not members:
+                continue
+            segment_id = create_segment(segment_name)
+            if not segment_id:
+                continue
+            current = set()
+        else:
+            try:
+                current = get_segment_members(segment_id)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error al obtener los miembros del segmento '{segment_name}': {e}")
+                continue
+
+        to_add = sorted(members - current)
+        for start in range(0, len(to_add), chunk_size):
+            results = add_contacts_to_segment(segment_id, to_add[start:start + chunk_size])
+            added += sum(1 for ok in results.values() if ok)
+        for contact_id in sorted(current - members):
+            if remove_contact_from_segment(segment_id, contact_id):
+                removed += 1
+
+    print(f"\nSegmentos sincronizados: {len(managed)}")
+    print(f"Contactos agregados: {added}")
+    print(f"Contactos quitados: {removed}")
+
+def process_segments(refresh_segments=False, chunk_size=SEGMENT_ADD_CHUNK_SIZE, reconcile=SEGMENT_RECONCILE,
+                     snapshot=None):
+    """
+    Asigna los contactos interesados en el boletín de clima al segmento
+    "Boletin clima - [nombre ciudad]" de cada una de sus ciudades.
+    Los contactos se leen de la vista compartida (ver contact_snapshot); si no se
+    recibe snapshot se usa la de esta ejecución.
+    Los segmentos se resuelven con una cache nombre → id descargada una sola vez;
+    refresh_segments=True fuerza a descargarla de nuevo al inicio.
+    Los contactos se agrupan por segmento y se agregan en bloques de chunk_size.
+    Con reconcile=True solo se aplican las diferencias, incluidas las bajas (ver reconcile_segments).
+    """
+    if snapshot is None:
+        snapshot = get_contact_snapshot()
+    if get_segment_index(refresh=refresh_segments) is None:
+        print("No se pudo consultar los segmentos existentes, no se crearán ni actualizarán segmentos.")
+        return
+    if reconcile:
+        reconcile_segments(snapshot, chunk_size)
+        return
+
+    for segment_name, members in sorted(get_desired_segments(snapshot).items()):
+        # Verificar si el segmento ya existe, de lo contrario se crea
+        segment_id = get_segment_by_name(segment_name)
+        if not segment_id:
+            segment_id = create_segment(segment_name)
+        if segment_id:
+            members = sorted(members)
+            for start in range(0, len(members), chunk_size):
+                add_contacts_to_segment(segment_id, members[start:start + chunk_size])
@@ -0,0 +1,72 @@
+import csv
+import unicodedata
+from config import GAZETTEER_PATH
+
+# Valores de la columna city_alias que habilitan la búsqueda por el nombre de la ciudad sola
+TRUE_VALUES = ("1", "true", "si", "sí", "yes", "x")
+
+def fold_name(name):
+    """
+    Normaliza un nombre de lugar para buscarlo en el gazetteer: sin tildes, en minúsculas,
+    con los espacios colapsados y ", " como separador entre ciudad y país.
+    Así "Bogotá, Colombia", "bogota,colombia" y "BOGOTA ,  Colombia" dan la misma clave.
+    """
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    parts = [" ".join(part.lower().split()) for part in without_accents.split(",")]
+    return ", ".join(part for part in parts if part)
+
+class Gazetteer:
+    """
+    Índice en memoria de coordenadas por nombre normalizado (ver fold_name), cargado
+    desde un CSV con columnas city, country, lat, lon y, opcionalmente, city_alias.
+    Cada ciudad se indexa como "ciudad, país". Solo las filas con city_alias activo
+    (1, true, sí...) se indexan también como "ciudad" sola, y únicamente si ninguna otra
+    fila marcada tiene el mismo nombre: un gazetteer parcial no puede saber si un nombre
+    sin país es ambiguo (Florencia, Córdoba, Santiago...), así que por defecto esos
+    nombres se resuelven con la cache y Nominatim.
+    """
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.index = {}
+        city_only = {}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                city = (row.get("city") or "").strip()
+                country = (row.get("country") or "").strip()
+                lat = (row.get("lat") or "").strip()
+                lon = (row.get("lon") or "").strip()
+                if not city or not lat or not lon:
+                    continue
+                if country:
+                    self.index.setdefault(fold_name(f"{city}, {country}"), (lat, lon))
+                if (row.get("city_alias") or "").strip().lower() in TRUE_VALUES:
+                    city_only.setdefault(fold_name(city), set()).add((lat, lon))
+        for key, coordinates in city_only.items():
+            if len(coordinates) == 1:
+                self.index.setdefault(key, next(iter(coordinates)))
+
+    def lookup(self, city):
+        """
+        Retorna (lat, lon) de la ciudad, o None si no está en el gazetteer.
+        """
+        return self.index.get(fold_name(city))
+
+    def __len__(self):
+        return len(self.index)
+
+_gazetteer = None
+
+def get_gazetteer():
+    """
+    Retorna el gazetteer cargado desde GAZETTEER_PATH; se carga la primera vez que se pide.
+    Si el archivo no existe o no se puede leer, retorna None y se sigue sin él.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        try:
+            _gazetteer = Gazetteer()
+        except (OSError, csv.Error) as e:
+            print(f"No se pudo cargar el gazetteer '{GAZETTEER_PATH}': {e}")
+            _gazetteer = False
+    return _gazetteer or None
@@ -1,53 +1,174 @@
 import os
 import imgkit
-import requests
-from config import MAUTIC_BASE_URL, MAUTIC_USERNAME, MAUTIC_PASSWORD
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import card_renderer
+from create_mails import load_bulletin_manifest, format_date
+from template_index import TEMPLATE_PREFIX
+from render_cache import RenderCache, render_key
+from image_output import image_output_options, needs_compaction, output_extension, compact_image
+from config import IMAGE_OUTPUT_DIR, IMAGE_RENDER_WORKERS, IMAGE_USE_CACHE, IMAGE_RENDERER
 
-def get_email_templates():
-    """
-    Obtiene todos los email templates desde Mautic.
-    Se usa el endpoint /api/emails y se retorna la lista de templates.
-    """
-    url = f"{MAUTIC_BASE_URL}/api/emails"
-    try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
-        response.raise_for_status()
-        data = response.json()
-        emails = data.get("emails", {})
-        return emails.values()
-    except Exception as e:
-        print("Error al obtener email templates:", e)
-        return []
+# Opciones con las que imgkit genera las imágenes; forman parte de la clave de la cache
+IMAGE_OPTIONS = {
+    'format': 'png',
+    'encoding': "UTF-8"
+}
 
 # Es necesario tener descargado wkhtmltopdf
 def generate_image_from_html(html_content, output_filename):
     """
     Convierte el contenido HTML en una imagen PNG usando imgkit.
     Asegúrate de que wkhtmltoimage esté instalado y en el PATH.
+    Retorna True si la imagen se generó, False en caso contrario.
     """
-    options = {
-        'format': 'png',
-        'encoding': "UTF-8"
-    }
     try:
-        imgkit.from_string(html_content, output_filename, options=options)
+        imgkit.from_string(html_content, output_filename, options=IMAGE_OPTIONS)
         print(f"Imagen guardada: {output_filename}")
+        return True
     except Exception as e:
         print(f"Error al generar la imagen '{output_filename}': {e}")
+        return False
+
+def render_image_job(job):
+    """
+    Genera una imagen a partir de un trabajo (html, archivo de salida, tarjeta, opciones de salida).
+    Si el trabajo trae los datos de la tarjeta (city, temperature, date) se dibuja con
+    Pillow (ver card_renderer); si no, se genera el HTML con imgkit.
+    Si trae opciones de salida, el PNG generado se convierte según ellas (ver image_output).
+    Retorna (archivo de salida, True/False); se ejecuta en los procesos del pool.
+    """
+    html_content, output_filename, card, output_options = job
+    rendered_filename = output_filename
+    if output_options is not None:
+        rendered_filename = f"{os.path.splitext(output_filename)[0]}.render.png"
+    if card is not None:
+        ok = card_renderer.render_bulletin_card(card["city"], card["temperature"], card["date"], rendered_filename)
+    else:
+        ok = generate_image_from_html(html_content, rendered_filename)
+    if ok and output_options is not None:
+        try:
+            size = compact_image(rendered_filename, output_filename, output_options)
+            print(f"Imagen compactada: {output_filename} ({size} bytes)")
+        except Exception as e:
+            print(f"Error al compactar la imagen '{output_filename}': {e}")
+            ok = False
+    if rendered_filename != output_filename and os.path.exists(rendered_filename):
+        os.remove(rendered_filename)
+    return output_filename, ok
+
+def render_images(jobs, workers=IMAGE_RENDER_WORKERS):
+    """
+    Genera las imágenes de una lista de trabajos (html, archivo de salida, tarjeta, opciones de salida).
+    Con workers distinto de 1 las imágenes se reparten entre varios procesos (None = uno
+    por núcleo); cada wkhtmltoimage usa un solo núcleo, así que se generan en paralelo.
+    Retorna un dict archivo de salida → True/False con el resultado de cada imagen.
+    """
+    if workers == 1 or len(jobs) <= 1:
+        return dict(render_image_job(job) for job in jobs)
 
-def create_images_bulletin():
-    emails = get_email_templates()
-    output_dir = "email_images"
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_image_job, job): job[1] for job in jobs}
+        for future in as_completed(futures):
+            output_filename = futures[future]
+            try:
+                results[output_filename] = future.result()[1]
+            except Exception as e:
+                print(f"Error al generar la imagen '{output_filename}': {e}")
+                results[output_filename] = False
+    return results
+
+def print_render_results(results):
+    failed = sorted(filename for filename, ok in results.items() if not ok)
+    print(f"\nImágenes generadas: {len(results) - len(failed)}")
+    print(f"Imágenes con error: {len(failed)}")
+    for filename in failed:
+        print(f"  - {filename}")
+
+def bulletin_card(bulletin):
+    """
+    Retorna los datos con los que se dibuja la tarjeta de un boletín, o None si el
+    boletín no los trae y hay que generar la imagen desde su HTML.
+    """
+    if not bulletin.get("city") or bulletin.get("temperature") is None:
+        return None
+    date_str = bulletin.get("time")
+    return {
+        "city": bulletin["city"],
+        "temperature": bulletin["temperature"],
+        "date": format_date(date_str) if date_str else "Sin fecha",
+    }
+
+def create_images_bulletin(bulletins=None, workers=IMAGE_RENDER_WORKERS, use_cache=IMAGE_USE_CACHE,
+                           renderer=IMAGE_RENDERER, output_options=None):
+    """
+    Genera una imagen por cada boletín "Boletin climatico - *" en IMAGE_OUTPUT_DIR,
+    repartiendo el trabajo entre workers procesos (ver render_images).
+    Los boletines (nombre → {"city", "temperature", "time", "html"}) son los que retorna
+    create_email_templates en esta ejecución; si no se reciben se leen del manifiesto
+    que dejó la última ejecución de la etapa de mails (ver load_bulletin_manifest).
+    Con use_cache=True las imágenes cuyo HTML no cambió desde una ejecución anterior
+    se copian de la cache de imágenes (ver render_cache) en lugar de generarse de nuevo.
+    renderer elige cómo se generan: "imgkit" (wkhtmltoimage sobre el HTML) o "pillow"
+    (tarjeta dibujada en el propio proceso, ver card_renderer); los boletines sin datos
+    de ciudad y temperatura, o si Pillow no está instalado, se generan con imgkit.
+    output_options define el formato, tamaño y peso de las imágenes (ver
+    image_output.image_output_options); por defecto se toman de config.
+    Retorna un dict archivo de salida → True/False con el resultado de cada imagen.
+    """
+    if renderer == "pillow" and not card_renderer.is_available():
+        print("Pillow no está instalado, las imágenes se generarán con imgkit.")
+        renderer = "imgkit"
+    if output_options is None:
+        output_options = image_output_options()
+    extension = output_extension(output_options)
+    if not needs_compaction(output_options):
+        output_options = None
+    if bulletins is None:
+        bulletins = load_bulletin_manifest()
+    output_dir = IMAGE_OUTPUT_DIR
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    for email in emails:
-        email_name = email.get("name")
-        custom_html = email.get("customHtml")
-        if email_name and custom_html:
+    jobs = []
+    for email_name, bulletin in bulletins.items():
+        if not email_name.startswith(TEMPLATE_PREFIX):
+            continue
+        custom_html = bulletin.get("html")
+        if custom_html:
             # Sanitizamos el nombre para usarlo como nombre de archivo
             safe_name = "".join(c if c.isalnum() or c in "._-" else "_" for c in email_name)
-            output_filename = os.path.join(output_dir, f"{safe_name}.png")
-            generate_image_from_html(custom_html, output_filename)
+            output_filename = os.path.join(output_dir, f"{safe_name}.{extension}")
+            card = bulletin_card(bulletin) if renderer == "pillow" else None
+            jobs.append((custom_html, output_filename, card, output_options))
         else:
-            print("No se encontró nombre o HTML para un email template.")
+            print(f"No se encontró el HTML del boletín '{email_name}'.")
+
+    cache = RenderCache() if use_cache else None
+    results = {}
+    pending = {}
+    for job in jobs:
+        custom_html, output_filename, card, _ = job
+        if cache is None:
+            pending[output_filename] = (job, None)
+            continue
+        options = IMAGE_OPTIONS if card is None else dict(IMAGE_OPTIONS, renderer="pillow")
+        if output_options is not None:
+            options = dict(options, output=output_options)
+        key = render_key(custom_html, options)
+        if cache.fetch(key, output_filename, extension):
+            print(f"Imagen reutilizada de la cache: {output_filename}")
+            results[output_filename] = True
+        else:
+            pending[output_filename] = (job, key)
+
+    rendered = render_images([job for job, _ in pending.values()], workers)
+    results.update(rendered)
+    if cache is not None:
+        for output_filename, ok in rendered.items():
+            if ok:
+                cache.store(pending[output_filename][1], output_filename, extension)
+        cache.evict()
+        cache.print_stats()
+    print_render_results(results)
+    return results
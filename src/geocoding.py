@@ -0,0 +1,156 @@
+import time
+import sqlite3
+import threading
+import requests
+from gazetteer import get_gazetteer
+from config import (
+    GEOCODE_CACHE_PATH,
+    GEOCODE_CACHE_TTL_DAYS,
+    GEOCODE_NEGATIVE_TTL_DAYS,
+    GEOCODE_MIN_INTERVAL,
+    GEOCODE_TIMEOUT,
+    GEOCODE_USE_GAZETTEER,
+    GEOCODE_REMOTE_FALLBACK,
+)
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search.php"
+DAY_SECONDS = 24 * 60 * 60
+
+# Contadores de la cache de geocodificación durante la ejecución
+geocode_stats = {
+    "gazetteer": 0,
+    "hits": 0,
+    "negative_hits": 0,
+    "misses": 0,
+    "errors": 0,
+}
+
+def normalize_city(city):
+    """
+    Clave de la cache para una ciudad: minúsculas y espacios colapsados.
+    """
+    return " ".join(str(city).strip().lower().split())
+
+class GeocodeCache:
+    """
+    Cache en disco (SQLite) de coordenadas por ciudad normalizada.
+    Las coordenadas de una ciudad no cambian, así que las entradas viven ttl_days;
+    las ciudades que Nominatim no pudo resolver también se guardan (sin coordenadas)
+    durante negative_ttl_days, para no volver a consultarlas en cada ejecución.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl_days=GEOCODE_CACHE_TTL_DAYS,
+                 negative_ttl_days=GEOCODE_NEGATIVE_TTL_DAYS):
+        self.ttl = ttl_days * DAY_SECONDS
+        self.negative_ttl = negative_ttl_days * DAY_SECONDS
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " city TEXT PRIMARY KEY,"
+            " lat TEXT,"
+            " lon TEXT,"
+            " fetched_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        """
+        Retorna (lat, lon) si la ciudad está en la cache y no ha vencido, (None, None)
+        si está guardada como no resoluble, o None si hay que consultarla.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT lat, lon, fetched_at FROM geocode WHERE city = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lon, fetched_at = row
+        ttl = self.ttl if lat is not None else self.negative_ttl
+        if time.time() - fetched_at > ttl:
+            return None
+        return lat, lon
+
+    def put(self, key, lat, lon):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO geocode (city, lat, lon, fetched_at) VALUES (?, ?, ?, ?)",
+                (key, lat, lon, time.time()),
+            )
+            self.connection.commit()
+
+_cache = None
+_last_request = 0.0
+_request_lock = threading.Lock()
+
+def get_geocode_cache():
+    global _cache
+    if _cache is None:
+        _cache = GeocodeCache()
+    return _cache
+
+def query_nominatim(city):
+    """
+    Consulta Nominatim respetando su límite de una petición por segundo.
+    Retorna (lat, lon), o (None, None) si la ciudad no se encontró.
+    Los errores de red se propagan para no guardarlos en la cache.
+    """
+    global _last_request
+    with _request_lock:
+        wait = GEOCODE_MIN_INTERVAL - (time.monotonic() - _last_request)
+        if wait > 0:
+            time.sleep(wait)
+        params = {"q": city, "format": "json"}
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        try:
+            response = requests.get(NOMINATIM_URL, params=params, headers=headers, timeout=GEOCODE_TIMEOUT)
+        finally:
+            _last_request = time.monotonic()
+    response.raise_for_status()
+    data = response.json()
+    if data:
+        return data[0]["lat"], data[0]["lon"]
+    return None, None
+
+def get_lat_lon_from_city(city):
+    """
+    Retorna la latitud y longitud de una ciudad. Se busca primero en el gazetteer local
+    (sin red), luego en la cache en disco y, solo si no está en ninguno, en Nominatim.
+    """
+    if GEOCODE_USE_GAZETTEER:
+        gazetteer = get_gazetteer()
+        coordinates = gazetteer.lookup(city) if gazetteer else None
+        if coordinates is not None:
+            geocode_stats["gazetteer"] += 1
+            return coordinates
+
+    key = normalize_city(city)
+    cache = get_geocode_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        if cached[0] is not None:
+            geocode_stats["hits"] += 1
+        else:
+            geocode_stats["negative_hits"] += 1
+        return cached
+
+    if not GEOCODE_REMOTE_FALLBACK:
+        print(f"No se encontró {city} en el gazetteer y la consulta a Nominatim está desactivada")
+        return None, None
+    geocode_stats["misses"] += 1
+    try:
+        lat, lon = query_nominatim(city)
+    except Exception as e:
+        geocode_stats["errors"] += 1
+        print(f"Error al obtener coordenadas para {city}: {e}")
+        return None, None
+    cache.put(key, lat, lon)
+    return lat, lon
+
+def print_geocode_stats():
+    print("\nCache de geocodificación:")
+    print(f"Resueltas con el gazetteer: {geocode_stats['gazetteer']}")
+    print(f"Aciertos: {geocode_stats['hits']}")
+    print(f"Aciertos negativos (ciudades no resolubles): {geocode_stats['negative_hits']}")
+    print(f"Consultas a Nominatim: {geocode_stats['misses']}")
+    print(f"Errores: {geocode_stats['errors']}")
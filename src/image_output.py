@@ -0,0 +1,112 @@
+import io
+try:
+    from PIL import Image, ImageChops
+except ImportError:  # Pillow es opcional: sin él las imágenes se dejan como las genera imgkit
+    Image = ImageChops = None
+from config import (
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    IMAGE_PALETTE_COLORS,
+    IMAGE_TARGET_WIDTH,
+    IMAGE_CROP_TO_CONTENT,
+    IMAGE_MAX_BYTES,
+)
+
+# Extensión del archivo según el formato de salida
+FORMAT_EXTENSIONS = {"png": "png", "png8": "png", "webp": "webp"}
+# Límites al reducir una imagen para que quepa en el presupuesto de bytes
+MIN_QUALITY = 30
+MIN_COLORS = 16
+MIN_WIDTH = 200
+SCALE_STEP = 0.85
+
+def image_output_options(output_format=IMAGE_FORMAT, quality=IMAGE_QUALITY, colors=IMAGE_PALETTE_COLORS,
+                         target_width=IMAGE_TARGET_WIDTH, crop=IMAGE_CROP_TO_CONTENT, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Retorna las opciones de salida de las imágenes, por defecto las de config.
+    """
+    return {
+        "format": output_format,
+        "quality": quality,
+        "colors": colors,
+        "target_width": target_width,
+        "crop": crop,
+        "max_bytes": max_bytes,
+    }
+
+def needs_compaction(options):
+    """
+    Retorna True si las opciones piden algo distinto del PNG tal como lo genera el renderer.
+    """
+    return bool(
+        options["format"] != "png" or options["target_width"] or options["crop"] or options["max_bytes"]
+    )
+
+def output_extension(options):
+    return FORMAT_EXTENSIONS[options["format"]]
+
+def crop_to_content(image):
+    """
+    Recorta los márgenes del color de fondo (el del pixel superior izquierdo).
+    """
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    bbox = ImageChops.difference(image, background).getbbox()
+    return image.crop(bbox) if bbox else image
+
+def resize_to_width(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+def encode_image(image, output_format, quality, colors):
+    """
+    Codifica la imagen en el formato pedido y retorna sus bytes:
+      - "png": PNG de color verdadero optimizado.
+      - "png8": PNG con paleta de hasta colors colores.
+      - "webp": WebP con la calidad indicada.
+    """
+    buffer = io.BytesIO()
+    if output_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=6)
+    elif output_format == "png8":
+        image.quantize(colors=colors).save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+def compact_image(source, destination, options):
+    """
+    Lee la imagen generada en source y la guarda en destination según las opciones de
+    salida (ver image_output_options): recorte al contenido, ancho máximo, formato y calidad.
+    Si se indica max_bytes y la imagen no cabe, se baja la calidad (WebP) o los colores
+    (PNG con paleta) y, como último recurso, se reduce el ancho hasta que quepa.
+    Retorna el tamaño final en bytes.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow no está instalado, no se pueden aplicar las opciones de salida")
+    with Image.open(source) as opened:
+        image = opened.convert("RGB")
+    if options["crop"]:
+        image = crop_to_content(image)
+    if options["target_width"] and image.width > options["target_width"]:
+        image = resize_to_width(image, options["target_width"])
+
+    output_format = options["format"]
+    quality = options["quality"]
+    colors = options["colors"]
+    data = encode_image(image, output_format, quality, colors)
+    max_bytes = options["max_bytes"]
+    while max_bytes and len(data) > max_bytes:
+        if output_format == "webp" and quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 10)
+        elif output_format == "png8" and colors > MIN_COLORS:
+            colors = max(MIN_COLORS, colors // 2)
+        elif image.width > MIN_WIDTH:
+            image = resize_to_width(image, max(MIN_WIDTH, int(image.width * SCALE_STEP)))
+        else:
+            print(f"La imagen '{destination}' ocupa {len(data)} bytes, más que el límite de {max_bytes}.")
+            break
+        data = encode_image(image, output_format, quality, colors)
+
+    with open(destination, "wb") as f:
+        f.write(data)
+    return len(data)
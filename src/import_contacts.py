@@ -1,6 +1,19 @@
-import json
+import asyncio
 import requests
-from config import MAUTIC_BASE_URL, MAUTIC_USERNAME, MAUTIC_PASSWORD
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from mautic_client import get_client, iter_contacts
+from users_reader import iter_users
+from contact_state import ContactStateCache
+from config import (
+    IMPORT_MODE,
+    IMPORT_BATCH_SIZE,
+    IMPORT_CONCURRENCY,
+    IMPORT_USE_CONTACT_INDEX,
+    IMPORT_USE_STATE_CACHE,
+    USERS_FILE,
+    USERS_FILE_FORMAT,
+)
 
 # Mapeo de campos: clave = campo en Mautic, valor = campo en el JSON
 field_mapping = {
@@ -15,9 +28,9 @@ field_mapping = {
 }
 
 def get_contact_by_mail(mail):
-    url = f"{MAUTIC_BASE_URL}/api/contacts?where[0][col]=email&where[0][expr]=eq&where[0][val]={mail}"
+    url = f"/api/contacts?where[0][col]=email&where[0][expr]=eq&where[0][val]={mail}"
     try:
-        response = requests.get(url, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD))
+        response = get_client().get(url)
         response.raise_for_status()
         data = response.json()
         contacts = data.get("contacts", {})
@@ -61,10 +74,10 @@ def normalize_value(field, value):
     return str(value).strip()
 
 def update_contact_in_mautic(contact_id, update_data):
-    url = f"{MAUTIC_BASE_URL}/api/contacts/{contact_id}/edit"
+    url = f"/api/contacts/{contact_id}/edit"
     headers = {'Content-Type': 'application/json'}
     try:
-        response = requests.patch(url, json=update_data, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD), headers=headers)
+        response = get_client().patch(url, json=update_data, headers=headers)
         response.raise_for_status()
         print(f"Contacto {contact_id} actualizado con: {update_data}")
         return contact_id
@@ -73,10 +86,10 @@ def update_contact_in_mautic(contact_id, update_data):
         return None
 
 def create_contact_in_mautic(new_contact):
-    url = f"{MAUTIC_BASE_URL}/api/contacts/new"
+    url = "/api/contacts/new"
     headers = {'Content-Type': 'application/json'}
     try:
-        response = requests.post(url, json=new_contact, auth=(MAUTIC_USERNAME, MAUTIC_PASSWORD), headers=headers)
+        response = get_client().post(url, json=new_contact, headers=headers)
         response.raise_for_status()
         contact_info = response.json().get("contact", {})
         contact_id = contact_info.get("id")
@@ -86,45 +99,357 @@ def create_contact_in_mautic(new_contact):
         print(f"Error al crear contacto {new_contact.get('email')}: {e}")
         return None
 
-def process_contact(json_contact, stats):
-    # Construir el nuevo contacto con valores normalizados
+def get_batch_results(data, size):
+    """
+    Traduce la respuesta de un endpoint batch de Mautic a una lista, alineada con
+    el payload enviado, de tuplas (ok, contacto, error).
+    Mautic indexa "contacts", "statusCodes" y "errors" por la posición del registro.
+    """
+    contacts = data.get("contacts") or {}
+    codes = data.get("statusCodes") or {}
+    errors = data.get("errors") or {}
+    if isinstance(contacts, list):
+        contacts = dict(enumerate(contacts))
+    if isinstance(codes, list):
+        codes = dict(enumerate(codes))
+    if isinstance(errors, list):
+        errors = dict(enumerate(errors))
+    results = []
+    for index in range(size):
+        contact = contacts.get(index, contacts.get(str(index)))
+        code = codes.get(index, codes.get(str(index)))
+        error = errors.get(index, errors.get(str(index)))
+        ok = error is None and contact is not None and code in (200, 201, None)
+        results.append((ok, contact, error or f"código de estado {code}"))
+    return results
+
+def update_contacts_batch(updates):
+    """
+    Actualiza varios contactos en una sola petición a /api/contacts/batch/edit.
+    updates es una lista de tuplas (contact_id, update_data).
+    Retorna, en el mismo orden, el id de cada contacto actualizado o None si falló.
+    """
+    url = "/api/contacts/batch/edit"
+    payload = [dict(update_data, id=contact_id) for contact_id, update_data in updates]
+    try:
+        response = get_client().patch(url, json=payload)
+        response.raise_for_status()
+        results = get_batch_results(response.json(), len(updates))
+    except requests.RequestException as e:
+        print(f"Error al actualizar lote de {len(updates)} contactos: {e}")
+        return [None] * len(updates)
+
+    updated_ids = []
+    for (contact_id, update_data), (ok, _, error) in zip(updates, results):
+        if ok:
+            print(f"Contacto {contact_id} actualizado con: {update_data}")
+            updated_ids.append(contact_id)
+        else:
+            print(f"Error al actualizar contacto {contact_id}: {error}")
+            updated_ids.append(None)
+    return updated_ids
+
+def create_contacts_batch(new_contacts):
+    """
+    Crea varios contactos en una sola petición a /api/contacts/batch/new.
+    Retorna, en el mismo orden, el id de cada contacto creado o None si falló.
+    """
+    url = "/api/contacts/batch/new"
+    try:
+        response = get_client().post(url, json=new_contacts)
+        response.raise_for_status()
+        results = get_batch_results(response.json(), len(new_contacts))
+    except requests.RequestException as e:
+        print(f"Error al crear lote de {len(new_contacts)} contactos: {e}")
+        return [None] * len(new_contacts)
+
+    created_ids = []
+    for new_contact, (ok, contact_info, error) in zip(new_contacts, results):
+        if ok:
+            contact_id = contact_info.get("id")
+            print(f"Contacto creado: {new_contact['email']} (ID: {contact_id})")
+            created_ids.append(contact_id)
+        else:
+            print(f"Error al crear contacto {new_contact.get('email')}: {error}")
+            created_ids.append(None)
+    return created_ids
+
+def build_contact_data(json_contact):
+    """
+    Construye el contacto para Mautic a partir del registro del JSON, con valores normalizados.
+    """
     new_contact_data = {}
     for mautic_field, json_field in field_mapping.items():
         raw_value = json_contact.get(json_field)
         new_contact_data[mautic_field] = normalize_value(mautic_field, raw_value)
-    
+    return new_contact_data
+
+def mail_key(mail):
+    """
+    Clave con la que se indexan los contactos por correo (Mautic no distingue mayúsculas).
+    """
+    return mail.strip().lower()
+
+def contact_values(contact):
+    """
+    Retorna los valores normalizados de los campos de field_mapping de un contacto de Mautic.
+    """
+    return {field: normalize_value(field, extract_field(contact, field)) for field in field_mapping}
+
+def build_contact_index():
+    """
+    Descarga una sola vez todos los contactos de Mautic (paginados) y construye un índice
+    correo → {"id": id del contacto, "values": valores normalizados de field_mapping}.
+    Si un correo está repetido en Mautic se conserva el contacto con menor id.
+    """
+    contact_index = {}
+    for contact in iter_contacts(fields=list(field_mapping)):
+        values = contact_values(contact)
+        mail = values.get("email")
+        if mail:
+            contact_index.setdefault(mail_key(mail), {"id": contact.get("id"), "values": values})
+    print(f"Índice de contactos construido: {len(contact_index)} correos.")
+    return contact_index
+
+class ContactIndex:
+    """
+    Índice por correo de los contactos de Mautic (ver build_contact_index).
+    Se construye la primera vez que se consulta, de modo que una importación en la que
+    todos los registros están en la caché local no descarga ningún contacto.
+    Si la descarga falla, cada consulta se resuelve buscando el contacto en la API.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.remote = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.entries is not None:
+                return
+            try:
+                self.entries = build_contact_index()
+            except requests.RequestException as e:
+                print(f"Error al construir el índice de contactos, se buscará cada contacto en la API: {e}")
+                # get() consulta entries sin el lock: remote debe quedar activo antes de
+                # publicar entries, o otro hilo vería un índice vacío y crearía duplicados
+                self.remote = True
+                self.entries = {}
+
+    def get(self, key):
+        if self.entries is None:
+            self.load()
+        if self.remote:
+            existing_contact = get_contact_by_mail(key)
+            return existing_contact and {"id": existing_contact.get("id"), "values": contact_values(existing_contact)}
+        return self.entries.get(key)
+
+    def __setitem__(self, key, entry):
+        # Antes de la descarga no hay nada que actualizar: la descarga traerá el estado real
+        if self.entries is not None and not self.remote:
+            self.entries[key] = entry
+
+def remember_contact(contact_index, contact_data, contact_id, contact_state=None):
+    """
+    Registra en el índice el estado del contacto tras crearlo o actualizarlo en Mautic,
+    para que un correo repetido en users.json se compare sin consultar la API.
+    Si hay caché local de estado, también se guarda allí para las próximas importaciones.
+    """
+    key = mail_key(contact_data["email"])
+    if contact_index is not None:
+        contact_index[key] = {"id": contact_id, "values": dict(contact_data)}
+    if contact_state is not None:
+        contact_state.remember(key, contact_id, contact_data)
+
+def plan_contact(json_contact, contact_index=None, contact_state=None):
+    """
+    Decide qué hacer con un registro del JSON sin escribir en Mautic.
+    Si se recibe contact_state y el registro no cambió desde la última importación, se
+    omite sin consultar la API. Si se recibe contact_index el contacto existente se busca
+    en él; si no, se consulta la API.
+    Retorna un dict con:
+      - action: "error" (sin correo), "existing" (ya actualizado), "update" o "create".
+      - mail, data (contacto normalizado), id (salvo para "create") y differences (solo para "update").
+      - cached: True si se resolvió con la caché local.
+    """
+    new_contact_data = build_contact_data(json_contact)
+
     mail = new_contact_data.get("email")
     if not mail:
         print("No se encontró correo, omitiendo contacto.")
-        stats["error"] += 1
-        return
+        return {"action": "error", "mail": None, "data": new_contact_data}
+
+    if contact_state is not None and contact_state.is_unchanged(mail_key(mail), new_contact_data):
+        print(f"Contacto con correo {mail} sin cambios desde la última importación; no se requiere acción.")
+        return {"action": "existing", "mail": mail, "data": new_contact_data, "cached": True}
     
-    existing_contact = get_contact_by_mail(mail)
-    if existing_contact:
+    if contact_index is not None:
+        existing = contact_index.get(mail_key(mail))
+    else:
+        existing_contact = get_contact_by_mail(mail)
+        existing = existing_contact and {"id": existing_contact.get("id"), "values": contact_values(existing_contact)}
+
+    plan = {"action": "create", "mail": mail, "data": new_contact_data}
+    if existing:
         differences = {}
-        for mautic_field, json_field in field_mapping.items():
-            new_value = normalize_value(mautic_field, json_contact.get(json_field))
-            existing_value = normalize_value(mautic_field, extract_field(existing_contact, mautic_field))
-            if new_value != existing_value:
+        for mautic_field in field_mapping:
+            new_value = new_contact_data[mautic_field]
+            if new_value != existing["values"][mautic_field]:
                 differences[mautic_field] = new_value
+        plan["id"] = existing["id"]
         if differences:
-            contact_id = existing_contact.get("id")
-            updated_id = update_contact_in_mautic(contact_id, differences)
-            if updated_id:
-                stats["updated"] += 1
-            else:
-                stats["error"] += 1
+            plan.update(action="update", differences=differences)
         else:
             print(f"Contacto con correo {mail} ya está actualizado; no se requiere acción.")
-            stats["existing"] += 1
-    else:
-        new_id = create_contact_in_mautic(new_contact_data)
-        if new_id:
-            stats["created"] += 1
+            plan["action"] = "existing"
+    return plan
+
+def apply_plan(plan):
+    """
+    Escribe en Mautic el cambio decidido por plan_contact.
+    Retorna el id del contacto creado o actualizado, o None si falló o no había nada que escribir.
+    """
+    if plan["action"] == "update":
+        return update_contact_in_mautic(plan["id"], plan["differences"])
+    if plan["action"] == "create":
+        return create_contact_in_mautic(plan["data"])
+    return None
+
+def record_result(plan, contact_id, stats, contact_index=None, contact_state=None):
+    """
+    Suma el resultado de un contacto a stats y, si se escribió en Mautic o se comprobó
+    que ya estaba actualizado, lo registra en el índice y en la caché local.
+    """
+    action = plan["action"]
+    if action in ("update", "create"):
+        if contact_id:
+            stats["updated" if action == "update" else "created"] += 1
+            remember_contact(contact_index, plan["data"], contact_id, contact_state)
         else:
             stats["error"] += 1
+    else:
+        stats[action] += 1
+        if action == "existing" and not plan.get("cached"):
+            remember_contact(None, plan["data"], plan["id"], contact_state)
+
+def process_contact(json_contact, stats, contact_index=None, contact_state=None):
+    plan = plan_contact(json_contact, contact_index, contact_state)
+    record_result(plan, apply_plan(plan), stats, contact_index, contact_state)
 
-def etl_import_contacts():
+def flush_contact_batches(pending_creates, pending_updates, stats, contact_index=None, contact_state=None):
+    """
+    Envía a Mautic los contactos pendientes de crear y actualizar, y vacía las listas.
+    """
+    if pending_creates:
+        created_ids = create_contacts_batch([plan["data"] for plan in pending_creates])
+        for plan, new_id in zip(pending_creates, created_ids):
+            record_result(plan, new_id, stats, contact_index, contact_state)
+        pending_creates.clear()
+    if pending_updates:
+        updated_ids = update_contacts_batch([(plan["id"], plan["differences"]) for plan in pending_updates])
+        for plan, updated_id in zip(pending_updates, updated_ids):
+            record_result(plan, updated_id, stats, contact_index, contact_state)
+        pending_updates.clear()
+
+def process_contacts_in_batches(contacts, stats, batch_size=IMPORT_BATCH_SIZE, contact_index=None,
+                                contact_state=None):
+    """
+    Agrupa las creaciones y actualizaciones en lotes de batch_size contactos y los
+    envía a los endpoints batch de Mautic.
+    """
+    pending_creates = []
+    pending_updates = []
+    pending_mails = set()
+    for contact in contacts:
+        plan = plan_contact(contact, contact_index, contact_state)
+        if plan["mail"] and mail_key(plan["mail"]) in pending_mails:
+            # Correo repetido en users.json con cambios aún sin enviar: se envía el lote
+            # y se vuelve a comparar contra el estado ya aplicado
+            flush_contact_batches(pending_creates, pending_updates, stats, contact_index, contact_state)
+            pending_mails.clear()
+            plan = plan_contact(contact, contact_index, contact_state)
+
+        if plan["action"] == "create":
+            pending_creates.append(plan)
+        elif plan["action"] == "update":
+            pending_updates.append(plan)
+        else:
+            record_result(plan, None, stats, contact_index, contact_state)
+            continue
+        pending_mails.add(mail_key(plan["mail"]))
+
+        if len(pending_creates) >= batch_size or len(pending_updates) >= batch_size:
+            flush_contact_batches(pending_creates, pending_updates, stats, contact_index, contact_state)
+            pending_mails.clear()
+    flush_contact_batches(pending_creates, pending_updates, stats, contact_index, contact_state)
+
+async def process_contacts_async(contacts, stats, concurrency=IMPORT_CONCURRENCY, contact_index=None,
+                                 contact_state=None):
+    """
+    Procesa los contactos de forma concurrente, con como máximo concurrency contactos en vuelo.
+    Las consultas y escrituras se ejecutan en un pool de hilos sobre el cliente compartido;
+    stats y el índice solo se modifican desde el event loop. Los registros con el mismo
+    correo se procesan en orden, uno tras otro, igual que en el modo secuencial.
+    Si un contacto lanza una excepción no se lanzan más, se espera a los que están en
+    vuelo y se relanza la primera, como haría el modo secuencial.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = {}
+    tasks = set()
+    failures = []
+
+    def task_done(task):
+        # Las tareas terminadas salen del conjunto antes del gather final: su excepción
+        # se guarda aquí para no perderla
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    async def run_contact(json_contact, previous, executor):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            plan = await loop.run_in_executor(executor, plan_contact, json_contact, contact_index, contact_state)
+            contact_id = await loop.run_in_executor(executor, apply_plan, plan)
+            record_result(plan, contact_id, stats, contact_index, contact_state)
+        finally:
+            semaphore.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for json_contact in contacts:
+            await semaphore.acquire()
+            if failures:
+                semaphore.release()
+                break
+            mail = normalize_value("email", json_contact.get(field_mapping["email"]))
+            key = mail_key(mail) if mail else None
+            task = asyncio.create_task(run_contact(json_contact, in_flight.get(key), executor))
+            tasks.add(task)
+            task.add_done_callback(task_done)
+            if key:
+                in_flight[key] = task
+                task.add_done_callback(lambda t, key=key: in_flight.get(key) is t and in_flight.pop(key))
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if failures:
+        raise failures[0]
+
+def etl_import_contacts(mode=IMPORT_MODE, batch_size=IMPORT_BATCH_SIZE, use_index=IMPORT_USE_CONTACT_INDEX,
+                        concurrency=IMPORT_CONCURRENCY, users_file=USERS_FILE, file_format=USERS_FILE_FORMAT,
+                        use_state_cache=IMPORT_USE_STATE_CACHE, force_resync=False):
+    """
+    Importa los contactos de users_file (array JSON o NDJSON, ver users_reader) a Mautic.
+      - mode="sequential": una petición por contacto (útil para depurar).
+      - mode="batch": creaciones y actualizaciones agrupadas en lotes de batch_size.
+      - mode="async": hasta concurrency contactos procesados a la vez.
+      - use_index: compara contra un índice por correo construido una sola vez,
+        en lugar de buscar cada contacto en la API.
+      - use_state_cache: omite sin llamar a la API los registros que no cambiaron desde la
+        última importación (ver contact_state).
+      - force_resync: ignora la caché local y compara todos los registros contra Mautic;
+        la caché se reescribe con el resultado.
+    """
     stats = {
         "created": 0,
         "updated": 0,
@@ -132,12 +457,22 @@ def etl_import_contacts():
         "error": 0
     }
     
-    users_file = 'users.json'
+    contact_index = ContactIndex() if use_index else None
+    contact_state = ContactStateCache(force_resync=force_resync) if use_state_cache else None
 
-    with open(users_file, 'r', encoding='utf-8') as file:
-        contacts = json.load(file)
-        for contact in contacts:
-            process_contact(contact, stats)
+    # Los registros se leen en streaming: nunca se carga el archivo completo en memoria
+    contacts = iter_users(users_file, file_format)
+    try:
+        if mode == "batch":
+            process_contacts_in_batches(contacts, stats, batch_size, contact_index, contact_state)
+        elif mode == "async":
+            asyncio.run(process_contacts_async(contacts, stats, concurrency, contact_index, contact_state))
+        else:
+            for contact in contacts:
+                process_contact(contact, stats, contact_index, contact_state)
+    finally:
+        if contact_state is not None:
+            contact_state.close()
     
     print("\nResumen del proceso ETL:")
     print(f"Contactos creados: {stats['created']}")
@@ -1,4 +1,6 @@
 from import_contacts import etl_import_contacts
+from contact_snapshot import build_contact_snapshot
+from weather import get_weather_snapshot
 from create_segments import process_segments
 from create_mails import create_email_templates
 from create_sms import create_sms_templates
@@ -13,17 +15,23 @@ def send_clima_bulletin():
     print("\nImportando contactos:")
     etl_import_contacts()
 
+    print("\nLeyendo contactos:")
+    snapshot = build_contact_snapshot()
+
     print("\nCreando segmentos:")
-    process_segments()
+    process_segments(snapshot=snapshot)
+
+    print("\nConsultando clima:")
+    weather = get_weather_snapshot(snapshot.cities)
 
     print("\nCreando mails:")
-    create_email_templates()
+    bulletins = create_email_templates(snapshot, weather)
 
     print("\nCreando text messages:")
-    create_sms_templates()
+    create_sms_templates(snapshot, weather)
 
     print("\nGenerando imagenes de los boletines:")
-    create_images_bulletin()
+    create_images_bulletin(bulletins)
 
     print("\nCreando campaña:")
     create_campaigns()
@@ -0,0 +1,178 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    MAUTIC_BASE_URL,
+    MAUTIC_USERNAME,
+    MAUTIC_PASSWORD,
+    MAUTIC_POOL_SIZE,
+    MAUTIC_TIMEOUT,
+    MAUTIC_MAX_RETRIES,
+    MAUTIC_BACKOFF_FACTOR,
+    MAUTIC_PAGE_SIZE,
+)
+
+# Códigos de estado ante los que se reintenta una petición idempotente
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Métodos que se pueden repetir sin efectos duplicados (los de urllib3 más PATCH)
+IDEMPOTENT_METHODS = Retry.DEFAULT_ALLOWED_METHODS | {"PATCH"}
+# Códigos con los que el servidor indica que no procesó la petición; solo ante ellos se reintenta un POST
+POST_RETRY_STATUS_CODES = (429, 503)
+
+class MauticClient:
+    """
+    Cliente de la API de Mautic construido sobre una sesión de requests.
+    La sesión reutiliza conexiones (keep-alive) mediante un pool, reintenta con
+    backoff exponencial ante errores de red, 5xx y 429, y aplica un timeout a
+    cada petición.
+    Los POST (creaciones) van por una sesión aparte que no los repite si la petición
+    pudo llegar al servidor (timeout de lectura, 5xx): solo se reintentan ante errores
+    de conexión y ante 429/503, respetando Retry-After, para no crear duplicados.
+    """
+
+    def __init__(self, base_url=MAUTIC_BASE_URL, username=MAUTIC_USERNAME, password=MAUTIC_PASSWORD,
+                 pool_size=MAUTIC_POOL_SIZE, timeout=MAUTIC_TIMEOUT,
+                 max_retries=MAUTIC_MAX_RETRIES, backoff_factor=MAUTIC_BACKOFF_FACTOR):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        post_retry = Retry(
+            total=max_retries,
+            read=0,
+            other=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=POST_RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session = self.create_session(username, password, pool_size, retry)
+        self.post_session = self.create_session(username, password, pool_size, post_retry)
+
+    @staticmethod
+    def create_session(username, password, pool_size, retry):
+        session = requests.Session()
+        session.auth = (username, password)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def url(self, path):
+        """
+        Construye la URL absoluta a partir de una ruta relativa de la API (p. ej. "/api/contacts").
+        """
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.post_session if method.upper() == "POST" else self.session
+        return session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def iter_entities(self, path, key, page_size=MAUTIC_PAGE_SIZE, params=None):
+        """
+        Recorre un listado de la API página a página y retorna las entidades a medida
+        que llegan, sin cargar el listado completo en memoria.
+        key es la clave del listado en la respuesta ("contacts", "lists", "emails", ...).
+        Se pagina por id (keyset): cada página pide los registros con id mayor al último
+        recibido, ordenados por id. A diferencia de start/limit, no se saltan ni repiten
+        registros si se crean o eliminan otros durante el recorrido, y no depende de que
+        el servidor respete page_size.
+        """
+        last_id = 0
+        while True:
+            page_params = dict(params or {})
+            page_params.update({
+                "start": 0,
+                "limit": page_size,
+                "orderBy": "id",
+                "orderByDir": "asc",
+                "where[0][col]": "id",
+                "where[0][expr]": "gt",
+                "where[0][val]": last_id,
+            })
+            response = self.get(path, params=page_params)
+            response.raise_for_status()
+            data = response.json()
+            entities = data.get(key) or {}
+            # Mautic retorna un dict indexado por id, o una lista vacía si no hay resultados
+            if isinstance(entities, dict):
+                entities = entities.values()
+            count = 0
+            for entity in entities:
+                count += 1
+                last_id = max(last_id, int(entity["id"]))
+                yield entity
+            # total es la cantidad de registros que quedaban (id > last_id) al pedir la página:
+            # si la página los trajo todos no hace falta pedir otra
+            total = data.get("total")
+            if count == 0 or (total is not None and count >= int(total)):
+                break
+
+    def close(self):
+        self.session.close()
+        self.post_session.close()
+
+_client = None
+
+def get_client():
+    """
+    Retorna el cliente de Mautic compartido por todas las etapas del proceso.
+    Se crea la primera vez que se solicita.
+    """
+    global _client
+    if _client is None:
+        _client = MauticClient()
+    return _client
+
+def project_contact(contact, fields):
+    """
+    Reduce un contacto a su id y a los campos indicados, conservando la estructura
+    de grupos ("core", "custom", ...) que usan las funciones extract_field.
+    """
+    projected = {}
+    for group, group_fields in contact.get("fields", {}).items():
+        if isinstance(group_fields, dict):
+            projected[group] = {f: v for f, v in group_fields.items() if f in fields}
+    return {"id": contact.get("id"), "fields": projected}
+
+def iter_contacts(fields=None, page_size=MAUTIC_PAGE_SIZE, minimal=True, search=None):
+    """
+    Recorre todos los contactos de Mautic página a página.
+      - fields: si se indica, cada contacto se reduce a su id y a esos campos.
+      - minimal: pide a Mautic los contactos sin listas adicionales.
+      - search: filtro de búsqueda de Mautic (p. ej. "segment:alias").
+    """
+    params = {}
+    if minimal:
+        params["minimal"] = "true"
+    if search:
+        params["search"] = search
+    for contact in get_client().iter_entities("/api/contacts", "contacts", page_size, params):
+        if fields is not None:
+            contact = project_contact(contact, fields)
+        yield contact
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_AGE_DAYS, IMAGE_CACHE_MAX_ENTRIES
+
+DAY_SECONDS = 24 * 60 * 60
+
+def render_key(html_content, options):
+    """
+    Clave de la cache: hash del HTML y de las opciones con las que se genera la imagen.
+    """
+    serialized = json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(serialized.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(html_content.encode("utf-8"))
+    return digest.hexdigest()
+
+class RenderCache:
+    """
+    Cache en disco de imágenes ya generadas, direccionada por contenido (ver render_key):
+    si el HTML y las opciones de una ciudad no cambiaron, la imagen se copia de la cache
+    en lugar de volver a generarla.
+    Cada uso actualiza la fecha de modificación del archivo; evict() borra las entradas
+    sin usar en max_age_days y, si aún sobran, las menos usadas recientemente hasta
+    dejar max_entries.
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_age_days=IMAGE_CACHE_MAX_AGE_DAYS,
+                 max_entries=IMAGE_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_age = max_age_days * DAY_SECONDS
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, extension="png"):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def fetch(self, key, output_filename, extension="png"):
+        """
+        Copia la imagen guardada con esa clave a output_filename.
+        Retorna True si estaba en la cache, False si hay que generarla.
+        """
+        cached = self.path(key, extension)
+        try:
+            shutil.copyfile(cached, output_filename)
+            os.utime(cached)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, output_filename, extension="png"):
+        """
+        Guarda en la cache una imagen recién generada.
+        """
+        cached = self.path(key, extension)
+        try:
+            # Se copia a un archivo temporal y se renombra para no dejar entradas a medias
+            temporary = f"{cached}.tmp"
+            shutil.copyfile(output_filename, temporary)
+            os.replace(temporary, cached)
+        except OSError as e:
+            print(f"Error al guardar '{output_filename}' en la cache de imágenes: {e}")
+
+    def evict(self):
+        """
+        Borra las entradas vencidas o sobrantes. Retorna cuántas se borraron.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort(reverse=True)
+        now = time.time()
+        removed = 0
+        for position, (mtime, path) in enumerate(entries):
+            if position >= self.max_entries or now - mtime > self.max_age:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    print(f"Error al borrar '{path}' de la cache de imágenes: {e}")
+        return removed
+
+    def print_stats(self):
+        print("\nCache de imágenes:")
+        print(f"Aciertos: {self.hits}")
+        print(f"Fallos: {self.misses}")
@@ -0,0 +1,67 @@
+import requests
+from mautic_client import get_client
+
+# Prefijo de los templates de email y SMS que generan las etapas del boletín
+TEMPLATE_PREFIX = "Boletin climatico - "
+# Tipo de template → (ruta del listado, clave del listado en la respuesta)
+TEMPLATE_ENDPOINTS = {
+    "email": ("/api/emails", "emails"),
+    "sms": ("/api/smses", "smses"),
+}
+
+# Cache tipo → {nombre normalizado → id}, compartida por las etapas de mails, SMS y campañas
+_template_indexes = {}
+
+def template_key(name):
+    """
+    Clave del índice: el nombre sin espacios en los extremos y en minúsculas.
+    """
+    return str(name).strip().lower()
+
+def load_template_index(kind):
+    """
+    Descarga el listado completo de templates del tipo indicado (paginado y con minimal,
+    sin el HTML ni el mensaje de cada uno) y retorna un dict nombre normalizado → id
+    con los templates "Boletin climatico - *".
+    """
+    path, key = TEMPLATE_ENDPOINTS[kind]
+    prefix = template_key(TEMPLATE_PREFIX)
+    index = {}
+    for template in get_client().iter_entities(path, key, params={"minimal": "true"}):
+        name = template_key(template.get("name") or "")
+        if name.startswith(prefix):
+            index.setdefault(name, template.get("id"))
+    return index
+
+def get_template_index(kind, refresh=False):
+    """
+    Retorna el índice nombre → id de los templates del tipo indicado ("email" o "sms").
+    Se descarga una sola vez por ejecución; con refresh=True se vuelve a descargar.
+    Retorna None si no se pudo descargar: sin el índice no se sabe qué templates existen,
+    así que no se debe crear ninguno. El fallo también se recuerda durante la ejecución,
+    para no volver a intentar la descarga por cada ciudad.
+    """
+    if kind not in _template_indexes or refresh:
+        try:
+            _template_indexes[kind] = load_template_index(kind)
+        except requests.RequestException as e:
+            print(f"Error al obtener los templates de tipo {kind}: {e}")
+            _template_indexes[kind] = None
+    return _template_indexes[kind]
+
+def get_template_id(kind, name):
+    """
+    Retorna el id del template con ese nombre (sin distinguir mayúsculas), o None si no
+    existe o si no se pudo descargar el índice (ver get_template_index).
+    """
+    index = get_template_index(kind)
+    if index is None:
+        return None
+    return index.get(template_key(name))
+
+def remember_template(kind, name, template_id):
+    """
+    Agrega al índice un template recién creado, para no tener que volver a descargarlo.
+    """
+    if _template_indexes.get(kind) is not None and template_id:
+        _template_indexes[kind][template_key(name)] = template_id
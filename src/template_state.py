@@ -0,0 +1,72 @@
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from config import TEMPLATE_STATE_PATH
+
+def content_hash(content):
+    """
+    Hash del contenido de un template (customHtml de un email o message de un SMS).
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class TemplateStateCache:
+    """
+    Hash del último contenido enviado a cada template de Mautic, guardado en SQLite e
+    indexado por tipo ("email" o "sms") e id del template.
+    Si el contenido generado coincide con el último enviado, el PATCH se puede omitir.
+    Los cambios hechos directamente en Mautic no se detectan; para eso las etapas de
+    mails y SMS aceptan force_update.
+    """
+
+    def __init__(self, path=TEMPLATE_STATE_PATH):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS template_state ("
+            " kind TEXT NOT NULL,"
+            " template_id INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL,"
+            " PRIMARY KEY (kind, template_id))"
+        )
+        self.connection.commit()
+
+    def is_unchanged(self, kind, template_id, content):
+        """
+        Retorna True si el template ya tiene exactamente este contenido según el último envío.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash FROM template_state WHERE kind = ? AND template_id = ?", (kind, template_id)
+            ).fetchone()
+        return row is not None and row[0] == content_hash(content)
+
+    def get_hash(self, kind, template_id):
+        """
+        Retorna el hash del último contenido enviado al template, o None si no se conoce.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash FROM template_state WHERE kind = ? AND template_id = ?", (kind, template_id)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def remember(self, kind, template_id, content):
+        """
+        Guarda el hash del contenido que quedó en el template.
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO template_state (kind, template_id, hash, updated_at) VALUES (?, ?, ?, ?)",
+                (kind, template_id, content_hash(content), datetime.now().isoformat(timespec="seconds")),
+            )
+            self.connection.commit()
+
+_state = None
+
+def get_template_state():
+    global _state
+    if _state is None:
+        _state = TemplateStateCache()
+    return _state
@@ -0,0 +1,110 @@
+import json
+from config import USERS_FILE_FORMAT, USERS_READ_CHUNK_SIZE
+
+_decoder = json.JSONDecoder()
+# Caracteres con los que puede empezar y continuar un número JSON
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+def iter_json_array(path, chunk_size=USERS_READ_CHUNK_SIZE):
+    """
+    Lee un archivo cuyo contenido es un array JSON y retorna sus elementos uno a uno,
+    leyendo el archivo por bloques de chunk_size caracteres.
+    En memoria solo se mantiene el bloque actual y el elemento que se está decodificando.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # Descarta lo ya consumido y agrega el siguiente bloque del archivo
+            nonlocal buffer, pos, eof
+            chunk = file.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise ValueError(f"'{path}' no contiene un array JSON.")
+        pos += 1
+
+        expect_value = True
+        after_comma = False
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"'{path}' termina antes de cerrar el array JSON.")
+            char = buffer[pos]
+            if char == "]":
+                if after_comma:
+                    raise ValueError(f"Coma final antes de cerrar el array JSON en '{path}'.")
+                # Después del cierre solo puede haber espacios: otro contenido indica un
+                # archivo truncado o concatenado
+                pos += 1
+                skip_whitespace()
+                if pos < len(buffer):
+                    raise ValueError(f"Contenido inesperado después del array JSON en '{path}'.")
+                return
+            if char == ",":
+                if expect_value:
+                    raise ValueError(f"Coma inesperada en '{path}'.")
+                expect_value = True
+                after_comma = True
+                pos += 1
+                continue
+            if not expect_value:
+                raise ValueError(f"Falta una coma entre elementos en '{path}'.")
+
+            while True:
+                try:
+                    value, end = _decoder.raw_decode(buffer, pos)
+                    # Un número puede quedar cortado en un prefijo válido ("1.5" de "1.5e10"):
+                    # si lo que sigue hasta el final del bloque aún podría continuarlo, se
+                    # lee el siguiente bloque antes de aceptarlo
+                    number_may_continue = buffer[pos] in NUMBER_START and all(
+                        char in NUMBER_CHARS for char in buffer[end:]
+                    )
+                    if eof or not number_may_continue:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+            pos = end
+            expect_value = False
+            after_comma = False
+            yield value
+
+def iter_ndjson(path):
+    """
+    Lee un archivo NDJSON (un objeto JSON por línea) y retorna los registros uno a uno.
+    Las líneas vacías se ignoran.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def iter_users(path, file_format=USERS_FILE_FORMAT):
+    """
+    Retorna los registros del archivo de usuarios sin cargarlo completo en memoria.
+    file_format puede ser "json" (array JSON), "ndjson" o "auto", que decide por la
+    extensión del archivo (.ndjson / .jsonl → NDJSON).
+    """
+    if file_format == "auto":
+        file_format = "ndjson" if path.endswith((".ndjson", ".jsonl")) else "json"
+    if file_format == "ndjson":
+        return iter_ndjson(path)
+    return iter_json_array(path)
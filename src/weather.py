@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import requests
+from geocoding import get_lat_lon_from_city, print_geocode_stats
+from config import (
+    WEATHER_BATCH_SIZE,
+    WEATHER_TIMEOUT,
+    WEATHER_GRID_RESOLUTION,
+    WEATHER_SNAPSHOT_PATH,
+    WEATHER_SNAPSHOT_MAX_AGE,
+)
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+def get_weather_from_lat_lon(lat, lon):
+    """
+    Consulta la API de Open-Meteo para obtener la temperatura actual y la fecha.
+    """
+    params = {"latitude": lat, "longitude": lon, "current_weather": "true"}
+    try:
+        response = requests.get(OPEN_METEO_URL, params=params, timeout=WEATHER_TIMEOUT)
+        if response.status_code == 200:
+            weather_data = response.json()
+            current = weather_data.get("current_weather", {})
+            temperature = current.get("temperature")
+            date_now = current.get("time")
+            return temperature, date_now
+    except Exception as e:
+        print("Error al obtener clima:", e)
+    return None, None
+
+def fetch_weather_batch(coordinates):
+    """
+    Consulta en una sola petición el clima actual de varias ubicaciones.
+    Open-Meteo acepta listas de latitudes y longitudes separadas por comas y responde
+    con una lista en el mismo orden (o un solo objeto si hay una única ubicación).
+    Retorna una lista de tuplas (temperatura, fecha) alineada con coordinates.
+    """
+    params = {
+        "latitude": ",".join(str(lat) for lat, _ in coordinates),
+        "longitude": ",".join(str(lon) for _, lon in coordinates),
+        "current_weather": "true",
+    }
+    response = requests.get(OPEN_METEO_URL, params=params, timeout=WEATHER_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    if isinstance(data, dict):
+        data = [data]
+    results = []
+    for location in data:
+        current = (location or {}).get("current_weather", {})
+        results.append((current.get("temperature"), current.get("time")))
+    # Si la respuesta trae menos ubicaciones de las pedidas, las faltantes quedan sin clima
+    results.extend([(None, None)] * (len(coordinates) - len(results)))
+    return results[:len(coordinates)]
+
+def grid_cell(lat, lon, resolution=WEATHER_GRID_RESOLUTION):
+    """
+    Retorna la celda de la grilla (lat, lon redondeadas a múltiplos de resolution grados)
+    en la que cae una ubicación. Con resolution 0 o None se usan las coordenadas exactas.
+    """
+    lat, lon = float(lat), float(lon)
+    if not resolution:
+        return lat, lon
+    return (
+        round(round(lat / resolution) * resolution, 6),
+        round(round(lon / resolution) * resolution, 6),
+    )
+
+def get_weather_for_cities(city_coordinates, batch_size=WEATHER_BATCH_SIZE,
+                           resolution=WEATHER_GRID_RESOLUTION, known_cells=None):
+    """
+    Obtiene el clima actual de todas las ciudades con peticiones agrupadas de hasta
+    batch_size ubicaciones.
+    city_coordinates es un dict ciudad → (lat, lon). Retorna un dict ciudad → (temperatura, fecha).
+    Las ciudades se agrupan por celda de la grilla (ver grid_cell): las que comparten
+    celda comparten una sola consulta. known_cells (celda → (temperatura, fecha)) permite
+    reutilizar celdas ya consultadas; se actualiza con las nuevas.
+    Solo las celdas que fallan dentro de un lote se consultan de nuevo una por una.
+    """
+    if known_cells is None:
+        known_cells = {}
+    city_cells = {city: grid_cell(lat, lon, resolution) for city, (lat, lon) in city_coordinates.items()}
+    cells = sorted({cell for cell in city_cells.values() if cell not in known_cells})
+    print(f"Clima: {len(city_cells)} ciudades en {len(set(city_cells.values()))} celdas, {len(cells)} por consultar.")
+
+    for start in range(0, len(cells), batch_size):
+        chunk = cells[start:start + batch_size]
+        try:
+            results = fetch_weather_batch(chunk)
+        except Exception as e:
+            print(f"Error al obtener clima de un lote de {len(chunk)} ubicaciones: {e}")
+            results = [(None, None)] * len(chunk)
+        for cell, result in zip(chunk, results):
+            if result[0] is None:
+                result = get_weather_from_lat_lon(*cell)
+            known_cells[cell] = result
+    return {city: known_cells.get(cell, (None, None)) for city, cell in city_cells.items()}
+
+def load_weather_snapshot(path=WEATHER_SNAPSHOT_PATH, max_age=WEATHER_SNAPSHOT_MAX_AGE):
+    """
+    Lee la foto del clima guardada en disco. Retorna el dict completo
+    {"generated_at", "cities"}, o None si no existe, no se puede leer o tiene más de
+    max_age segundos.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        print(f"Error al leer '{path}': {e}")
+        return None
+    if time.time() - snapshot.get("generated_at", 0) > max_age:
+        return None
+    return snapshot
+
+def save_weather_snapshot(snapshot, path=WEATHER_SNAPSHOT_PATH):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"Error al guardar '{path}': {e}")
+
+def build_weather_snapshot(cities, known_cells=None):
+    """
+    Geocodifica las ciudades y consulta su clima en lotes.
+    Retorna un dict ciudad → {"lat", "lon", "cell", "temperature", "time"} solo con las
+    ciudades de las que se obtuvo el clima.
+    """
+    city_coordinates = {}
+    for city in cities:
+        lat, lon = get_lat_lon_from_city(city)
+        if lat and lon:
+            city_coordinates[city] = (lat, lon)
+        else:
+            print(f"No se pudieron obtener coordenadas para {city}")
+    print_geocode_stats()
+
+    # El clima de todas las ciudades se consulta en lotes, no una petición por ciudad
+    weather = get_weather_for_cities(city_coordinates, known_cells=known_cells)
+    entries = {}
+    for city, (lat, lon) in city_coordinates.items():
+        temperature, date_now = weather.get(city, (None, None))
+        if temperature is not None:
+            entries[city] = {
+                "lat": lat,
+                "lon": lon,
+                "cell": list(grid_cell(lat, lon)),
+                "temperature": temperature,
+                "time": date_now,
+            }
+        else:
+            print(f"No se pudo obtener el clima para {city}")
+    return entries
+
+_weather_snapshot = None
+# Ciudades ya consultadas en esta ejecución, aunque no se haya obtenido su clima
+_attempted = set()
+
+def get_weather_snapshot(cities, refresh=False):
+    """
+    Retorna la foto del clima de esta ejecución (ciudad → datos), compartida por las etapas
+    de mails y SMS para que ambas usen la misma lectura de cada ciudad.
+    Se reutiliza la foto en memoria o, si no hay, la guardada en disco mientras no supere
+    WEATHER_SNAPSHOT_MAX_AGE; solo se consultan las ciudades que falten, y el resultado
+    se vuelve a guardar en disco. Con refresh=True se consultan todas de nuevo.
+    """
+    global _weather_snapshot
+    if refresh:
+        _weather_snapshot = None
+        _attempted.clear()
+    elif _weather_snapshot is None:
+        _weather_snapshot = load_weather_snapshot()
+    if _weather_snapshot is None:
+        _weather_snapshot = {"generated_at": time.time(), "cities": {}}
+
+    entries = _weather_snapshot["cities"]
+    missing = [city for city in cities if city not in entries and city not in _attempted]
+    if missing:
+        _attempted.update(missing)
+        # Las celdas ya presentes en la foto se reutilizan para las ciudades nuevas
+        known_cells = {
+            tuple(entry["cell"]): (entry["temperature"], entry["time"])
+            for entry in entries.values() if entry.get("cell")
+        }
+        entries.update(build_weather_snapshot(missing, known_cells))
+        save_weather_snapshot(_weather_snapshot)
+    return entries
+
+def get_city_weather(city):
+    """
+    Retorna (temperatura, fecha) de la ciudad según la foto del clima de esta ejecución.
+    """
+    entry = get_weather_snapshot([city]).get(city)
+    if entry is None:
+        return None, None
+    return entry["temperature"], entry["time"]